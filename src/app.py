@@ -3,9 +3,13 @@ import matplotlib.ticker as ticker
 from matplotlib import cm
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
 import numpy as np
+import os
 import tkinter as tk
+from PIL import Image, ImageTk
 from tkinter import ttk
 from film import *
+from illuminant import *
+from material import *
 from spectrum import *
 from config import *
 
@@ -43,6 +47,8 @@ class App(tk.Frame):
         テクスチャ描画用キャンバス
     var_polarized : int
         偏光状態
+    var_illuminant : StringVar
+        光源名
     fig_2D : Figure
         2Dグラフ描画用のmatplotlibのFigureオブジェクト
     ax_2D : AxesSubplot
@@ -74,6 +80,10 @@ class App(tk.Frame):
         self.window.geometry("960x540")
         self.window.state("zoomed")
 
+        # 計算結果のディスクキャッシュ
+        if get_disk_cache() is None:
+            set_disk_cache(os.path.join(os.path.expanduser('~'), '.cache', 'thinfilm_visualizer'))
+
         # スペクトルデータ
         self.spd = Spectrum(constv=0.5)
 
@@ -88,7 +98,7 @@ class App(tk.Frame):
         self.var_eta_base.set(1.00)
 
         # 薄膜データ
-        film1 = ThinFilm(0, Spectrum(constv=1.0)) # 空気層
+        film1 = get_material('air').film() # 空気層
         film2 = ThinFilm(self.var_thickness.get(), 
                          Spectrum(constv=self.var_eta_film.get())) # 薄膜層
         film3 = ThinFilm(0, Spectrum(constv=self.var_eta_base.get())) # ベース層
@@ -208,6 +218,21 @@ class App(tk.Frame):
                                           )
         radio_s_polarized.grid(row=0, column=2, padx=PADX, sticky="ew")
 
+        # 光源の選択
+        frm_illuminant = ttk.Frame(master=frm_param_ajust)
+        frm_illuminant.pack(padx=PADX, pady=PADY)
+        lbl_illuminant = ttk.Label(master=frm_illuminant, text="Light")
+        lbl_illuminant.grid(row=0, column=0, padx=(0,PADX), sticky="ew")
+        self.var_illuminant = tk.StringVar()
+        self.var_illuminant.set('E')
+        combo_illuminant = ttk.Combobox(master=frm_illuminant,
+                                        values=list(ILLUMINANTS),
+                                        textvariable=self.var_illuminant,
+                                        state="readonly"
+                                        )
+        combo_illuminant.grid(row=0, column=1, sticky="ew")
+        combo_illuminant.bind("<<ComboboxSelected>>", self.change_illuminant)
+
         # セパレータ
         separator3 = ttk.Separator(master=frm_param_ajust)
         separator3.pack(fill=tk.X, padx=PADX, pady=PADY)
@@ -314,9 +339,8 @@ class App(tk.Frame):
             プロット線のRGB値
         """
         linename = str(int(angle)) + "°"
-        linecolor = self.spd.to_rgb()
-        inv_gamma = 1 / 2.2
-        linecolor = np.clip(linecolor, 0.0, 1.0) ** inv_gamma # ガンマ補正
+        linecolor = self.spd.to_rgb(get_illuminant(self.var_illuminant.get()))
+        linecolor = srgb_encode(gamut_clip(linecolor)) # ガンマ補正
         c_max = linecolor.max()
         if c_max < 0.7 and c_max > 0:
             linecolor *= 0.7/c_max
@@ -335,7 +359,7 @@ class App(tk.Frame):
         """2Dグラフを描画"""
         angle = self.var_angle.get() # 入射角
         cos_incident = np.cos(to_radian(angle))
-        self.spd = self.irid.evaluate(cos_incident, self.var_polarized.get())
+        self.spd = self.irid.evaluate(cos_incident, self.var_polarized.get(), adaptive=True)
         linecolor, linename = self.decide_line_color_and_name(self.spd, angle)
         # プロット
         self.ax_2D.plot(self.spd.wl, self.spd.c, label=linename, color=linecolor)
@@ -354,12 +378,8 @@ class App(tk.Frame):
         x = spd.wl
         y = np.linspace(0, 89, 90) # 0-90度の入射角
         X, Y = np.meshgrid(x, y)
-        Z = np.zeros_like(X)
-        for i in range(90):
-            temp = self.irid.evaluate(np.cos(np.pi/180 * i), 
-                                      self.var_polarized.get())
-            for j in range(NSAMPLESPECTRUM):
-                Z[i][j] = temp.c[j]
+        Z = self.irid.evaluate_angles(np.cos(np.pi/180 * y),
+                                      self.var_polarized.get()).filled(0.0)
         # プロット
         self.ax_3D.plot_surface(X, Y, Z, cmap=cm.plasma, 
                                 linewidth=0, antialiased=False)
@@ -385,11 +405,10 @@ class App(tk.Frame):
         d  = round(self.var_thickness.get(),1)
         n1 = round(self.var_eta_film.get(), 2)
         n2 = round(self.var_eta_base.get(), 2)
-        film1 = ThinFilm(0.0, Spectrum(constv=1.0))
+        film1 = get_material('air').film()
         film2 = ThinFilm(d, Spectrum(constv=n1))
         film3 = ThinFilm(0.0, Spectrum(constv=n2))
-        films = [film1, film2, film3]
-        self.irid.films = films
+        self.irid.films = FilmStack([film1, film2, film3])
         self.update()
         canvas_width = self.canvas_texture.winfo_width()
         canvas_height = self.canvas_texture.winfo_height()
@@ -403,6 +422,25 @@ class App(tk.Frame):
         self.plot_graph_3D() # 3Dの描画
 
 
+    def change_illuminant(self, event=None):
+        """
+        光源の変更時にテクスチャを再描画
+
+        Notes
+        -----
+        反射率はキャッシュされているため色の変換のみ再計算する
+        """
+        if self.irid_texture is None:
+            return
+        canvas_width = self.canvas_texture.winfo_width()
+        canvas_height = self.canvas_texture.winfo_height()
+        self.create_texture(canvas_width, canvas_height)
+        self.canvas_texture.create_image(canvas_width/2,
+                                         canvas_height/2,
+                                         image=self.irid_texture
+                                         )
+
+
     def create_texture(self, width, height):
         """
         テクスチャを生成
@@ -414,12 +452,12 @@ class App(tk.Frame):
         height : int
             テクスチャ高さ
         """
-        inv_gamma = 1 / 2.2
-        img_array = self.irid.create_texture(width, height)
-        img_array = 255 * (img_array ** inv_gamma) # ガンマ補正
-        img_array = img_array.astype(np.uint8)
+        illuminant = get_illuminant(self.var_illuminant.get())
+        img_array = self.irid.create_texture(width, height, adaptive=True,
+                                             illuminant=illuminant)
+        img_array = srgb_quantize(img_array, 8) # ガンマ補正
 
-        img = Image.fromarray(np.uint8(img_array))
+        img = Image.fromarray(img_array)
         self.irid_texture = ImageTk.PhotoImage(image=img)
 
 
@@ -0,0 +1,85 @@
+import os
+import subprocess
+import sys
+
+
+# 定数
+BENCH_MODULES = ('utility', 'cmf', 'spectrum', 'film', 'material', 'illuminant', 'sweep')
+BENCH_GUI_MODULES = ('matplotlib', 'PIL', 'tkinter') # 物理計算のモジュールから読み込まれてはならない
+BENCH_REPEAT = 5 # 計測の繰り返し回数
+
+BENCH_CODE = """
+import sys, time
+t = time.perf_counter()
+import numpy
+t_numpy = time.perf_counter()
+import {module}
+t_module = time.perf_counter()
+gui = [m for m in {gui!r} if m in sys.modules]
+print(t_numpy - t, t_module - t_numpy, ','.join(gui))
+"""
+
+
+def measure_import(module, repeat=BENCH_REPEAT):
+    """
+    モジュールのimport時間を新しいプロセスで計測
+
+    Parameters
+    ----------
+    module : string
+        モジュール名
+    repeat : int
+        計測の繰り返し回数
+
+    Returns
+    -------
+    t_numpy : float
+        numpyのimport時間の最小値(秒)
+    t_module : float
+        numpyを除いたモジュールのimport時間の最小値(秒)
+    gui : list of string
+        読み込まれたGUI関連のモジュール
+
+    Notes
+    -----
+    毎回新しいインタプリタで計測するため，ワーカープロセスやCLIの起動時間に相当する
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    code = BENCH_CODE.format(module=module, gui=BENCH_GUI_MODULES)
+    t_numpy = t_module = float('inf')
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', code], cwd=directory,
+                             capture_output=True, text=True, check=True).stdout.split()
+        t_numpy = min(t_numpy, float(out[0]))
+        t_module = min(t_module, float(out[1]))
+        gui = out[2].split(',') if len(out) > 2 else []
+    return t_numpy, t_module, gui
+
+
+def main(modules=BENCH_MODULES):
+    """
+    各モジュールのimport時間を表示
+
+    Parameters
+    ----------
+    modules : tuple of string
+        計測するモジュール名
+
+    Returns
+    -------
+    status : int
+        GUI関連のモジュールが読み込まれた場合は1
+    """
+    status = 0
+    print('{:<12} {:>10} {:>10}  {}'.format('module', 'numpy[ms]', 'module[ms]', 'gui'))
+    for module in modules:
+        t_numpy, t_module, gui = measure_import(module)
+        print('{:<12} {:>10.1f} {:>10.1f}  {}'.format(
+            module, 1e3 * t_numpy, 1e3 * t_module, ','.join(gui) or '-'))
+        if gui:
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main(tuple(sys.argv[1:]) or BENCH_MODULES))
@@ -0,0 +1,395 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+from utility import *
+
+
+# 定数
+CACHE_MAX_BYTES = 256 * 1024 ** 2 # メモリキャッシュの既定の上限(バイト)
+DISK_CACHE_MAX_BYTES = 1024 ** 3   # ディスクキャッシュの既定の上限(バイト)
+DISK_CACHE_RESCAN_PUTS = 1000      # ディスクキャッシュの合計バイト数を数え直す書き込み回数(他プロセスの書き込みの反映用)
+DISK_CACHE_ENV = 'THINFILM_CACHE_DIR' # ディスクキャッシュの場所を指定する環境変数
+DISK_CACHE_SUBDIR = 'thinfilm_cache'  # 指定されたディレクトリ内でキャッシュが専有するディレクトリ
+DISK_CACHE_VERSION_PATTERN = re.compile(r'v\d+')              # バージョンごとのディレクトリ名
+DISK_CACHE_ENTRY_PATTERN = re.compile(r'[0-9a-f]{32}\.npy|tmp\w+\.tmp') # エントリと書き込み中の一時ファイル名
+
+
+def array_digest(*values):
+    """
+    数値や配列の並びから正規化したハッシュ値を計算
+
+    Parameters
+    ----------
+    values : tuple
+        ハッシュ値を計算する値(数値，文字列，ndarrayまたはそれらのタプル)
+
+    Returns
+    -------
+    digest : string
+        16進数のハッシュ値
+
+    Notes
+    -----
+    配列は型と形状を含めて連続したバイト列としてハッシュ化する
+    """
+    h = hashlib.blake2b(digest_size=16)
+
+    def update(value):
+        if isinstance(value, (tuple, list)):
+            h.update(b'(')
+            for v in value:
+                update(v)
+            h.update(b')')
+        elif isinstance(value, np.ndarray):
+            h.update(b'a' + str(value.dtype).encode() + str(value.shape).encode())
+            h.update(np.ascontiguousarray(value).tobytes())
+        else:
+            h.update(b'v' + repr(value).encode())
+
+    for value in values:
+        update(value)
+    return h.hexdigest()
+
+
+def value_nbytes(value):
+    """
+    キャッシュする値のおおよそのバイト数
+
+    Parameters
+    ----------
+    value : object
+        キャッシュする値
+
+    Returns
+    -------
+    n : int
+        バイト数
+    """
+    if isinstance(value, np.ma.MaskedArray):
+        return value.data.nbytes + np.ma.getmaskarray(value).nbytes
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(value_nbytes(v) for v in value)
+    return 64
+
+
+class LRUCache:
+    """
+    バイト数の上限つきLRUキャッシュ
+
+    Attributes
+    ----------
+    __max_bytes : int
+        保持する値の合計バイト数の上限
+    __entries : OrderedDict
+        キーと(値, バイト数)の組(末尾ほど最近使用)
+    __nbytes : int
+        保持している値の合計バイト数
+    __hits : int
+        ヒット数
+    __misses : int
+        ミス数
+    __lock : Lock
+        スレッド間の排他制御用のロック
+    """
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        """
+        初期化
+
+        Parameters
+        ----------
+        max_bytes : int
+            保持する値の合計バイト数の上限
+        """
+        self.__max_bytes = max_bytes
+        self.__entries = OrderedDict()
+        self.__nbytes = 0
+        self.__hits = 0
+        self.__misses = 0
+        self.__lock = threading.Lock()
+
+    @property
+    def max_bytes(self):
+        return self.__max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, n):
+        with self.__lock:
+            self.__max_bytes = n
+            self.__evict()
+
+    def get(self, key):
+        """
+        値を取得
+
+        Parameters
+        ----------
+        key : hashable
+            キー
+
+        Returns
+        -------
+        value : object
+            キャッシュされた値(存在しない場合はNone)
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                self.__misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.__hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """
+        値を登録
+
+        Parameters
+        ----------
+        key : hashable
+            キー
+        value : object
+            値
+
+        Notes
+        -----
+        上限を超える値は登録しない
+        """
+        size = value_nbytes(value)
+        with self.__lock:
+            if key in self.__entries:
+                self.__nbytes -= self.__entries.pop(key)[1]
+            if size > self.__max_bytes:
+                return
+            self.__entries[key] = (value, size)
+            self.__nbytes += size
+            self.__evict()
+
+    def clear(self):
+        """全ての値を削除し統計をリセット"""
+        with self.__lock:
+            self.__entries.clear()
+            self.__nbytes = 0
+            self.__hits = 0
+            self.__misses = 0
+
+    def stats(self):
+        """
+        キャッシュの統計情報
+
+        Returns
+        -------
+        stats : dict
+            ヒット数，ミス数，エントリ数，合計バイト数，上限バイト数
+        """
+        with self.__lock:
+            return {'hits': self.__hits,
+                    'misses': self.__misses,
+                    'entries': len(self.__entries),
+                    'nbytes': self.__nbytes,
+                    'max_bytes': self.__max_bytes}
+
+    def __evict(self):
+        """上限を超えた分を古いものから削除(ロック取得済みで呼ぶ)"""
+        while self.__nbytes > self.__max_bytes and self.__entries:
+            _, (_, size) = self.__entries.popitem(last=False)
+            self.__nbytes -= size
+
+    def __len__(self):
+        return len(self.__entries)
+
+
+class DiskCache:
+    """
+    ディレクトリ内の.npyファイルに配列を保持するLRUキャッシュ
+
+    Attributes
+    ----------
+    __directory : string
+        バージョンごとのキャッシュディレクトリ
+    __max_bytes : int
+        保持するファイルの合計バイト数の上限
+    __hits : int
+        ヒット数
+    __misses : int
+        ミス数
+    __nbytes : int
+        このプロセスで把握しているエントリの合計バイト数
+    __puts : int
+        合計バイト数を数え直してからの書き込み回数
+    __lock : Lock
+        合計バイト数の更新の排他制御用のロック
+
+    Notes
+    -----
+    ファイル名はキーのハッシュ値
+    書き込みは一時ファイルからの置き換えで行うため，
+    複数のプロセスから同時に使用しても壊れたファイルは読まれない
+    ファイルの更新時刻を最終使用時刻として古いものから削除する
+    合計バイト数は初期化時に一度だけ数え，書き込みごとに加算する
+    ディレクトリの走査は合計が上限を超えたときとDISK_CACHE_RESCAN_PUTS回の書き込みごとにのみ行う
+    エントリは指定されたディレクトリ内のDISK_CACHE_SUBDIR/v<バージョン>に保持し，
+    初期化時にはDISK_CACHE_SUBDIR内のバージョンが異なるv<数字>のディレクトリのみ削除する
+    (指定されたディレクトリ内の他のファイルやディレクトリには触れない)
+    """
+
+    def __init__(self, directory, version, max_bytes=DISK_CACHE_MAX_BYTES):
+        """
+        初期化
+
+        Parameters
+        ----------
+        directory : string
+            キャッシュディレクトリ(DISK_CACHE_SUBDIRを作成してその中に保持)
+        version : int or string
+            計算コードのバージョン(変わると既存のエントリは無効)
+        max_bytes : int
+            保持するファイルの合計バイト数の上限
+        """
+        name = 'v' + str(version)
+        root = os.path.join(directory, DISK_CACHE_SUBDIR)
+        self.__directory = os.path.join(root, name)
+        self.__max_bytes = max_bytes
+        self.__hits = 0
+        self.__misses = 0
+        self.__puts = 0
+        self.__lock = threading.Lock()
+        os.makedirs(self.__directory, exist_ok=True)
+        # 古いバージョンのエントリを削除
+        for entry in os.listdir(root):
+            path = os.path.join(root, entry)
+            if (entry != name and DISK_CACHE_VERSION_PATTERN.fullmatch(entry)
+                    and os.path.isdir(path)):
+                shutil.rmtree(path, ignore_errors=True)
+        self.__nbytes = sum(size for _, size, _ in self.__scan())
+
+    @property
+    def directory(self):
+        return self.__directory
+
+    def __path(self, key):
+        return os.path.join(self.__directory, array_digest(key) + '.npy')
+
+    def get(self, key):
+        """
+        配列を取得
+
+        Parameters
+        ----------
+        key : tuple
+            キー(array_digestでハッシュ化できる値)
+
+        Returns
+        -------
+        value : ndarray
+            キャッシュされた配列(存在しない場合はNone)
+        """
+        path = self.__path(key)
+        try:
+            value = np.load(path, allow_pickle=False)
+            os.utime(path) # 最終使用時刻の更新
+        except (OSError, ValueError): # 存在しないか壊れている
+            self.__misses += 1
+            return None
+        self.__hits += 1
+        return value
+
+    def put(self, key, value):
+        """
+        配列を登録
+
+        Parameters
+        ----------
+        key : tuple
+            キー(array_digestでハッシュ化できる値)
+        value : ndarray
+            配列
+        """
+        path = self.__path(key)
+        fd, tmp = tempfile.mkstemp(dir=self.__directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, np.asarray(value), allow_pickle=False)
+                size = f.tell()
+            os.chmod(tmp, FILE_MODE) # 一時ファイルは所有者のみ読み書き可のため
+            try:
+                size -= os.stat(path).st_size # 置き換えるエントリの分
+            except OSError:
+                pass
+            os.replace(tmp, path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        with self.__lock:
+            self.__nbytes += size
+            self.__puts += 1
+            if self.__nbytes <= self.__max_bytes and self.__puts < DISK_CACHE_RESCAN_PUTS:
+                return
+            self.__evict()
+
+    def clear(self):
+        """全てのエントリを削除(キャッシュが作成したファイルのみ)"""
+        for entry in os.scandir(self.__directory):
+            if DISK_CACHE_ENTRY_PATTERN.fullmatch(entry.name) and entry.is_file():
+                try:
+                    os.remove(entry.path)
+                except OSError: # 他のプロセスが削除済み
+                    pass
+        with self.__lock:
+            self.__nbytes = 0
+
+    def stats(self):
+        """
+        キャッシュの統計情報
+
+        Returns
+        -------
+        stats : dict
+            ヒット数，ミス数，エントリ数，合計バイト数，上限バイト数
+        """
+        entries = self.__scan()
+        return {'hits': self.__hits,
+                'misses': self.__misses,
+                'entries': len(entries),
+                'nbytes': sum(size for _, size, _ in entries),
+                'max_bytes': self.__max_bytes}
+
+    def __scan(self):
+        """エントリの(更新時刻, バイト数, パス)の一覧"""
+        entries = []
+        for entry in os.scandir(self.__directory):
+            if entry.name.endswith('.npy') and DISK_CACHE_ENTRY_PATTERN.fullmatch(entry.name):
+                try:
+                    stat = entry.stat()
+                except OSError: # 他のプロセスが削除済み
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def __evict(self):
+        """合計バイト数を数え直し，上限を超えた分を最終使用時刻の古いものから削除(ロック取得済みで呼ぶ)"""
+        entries = self.__scan()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.__max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+        self.__nbytes = total
+        self.__puts = 0
+
+
+# 薄膜干渉計算の結果を保持する既定のキャッシュ
+EVAL_CACHE = LRUCache()
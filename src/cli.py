@@ -0,0 +1,282 @@
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from film import *
+from illuminant import *
+from material import *
+from spectrum import *
+from utility import *
+
+
+# 定数
+CLI_OUTPUT_DIR = 'out'   # 既定の出力ディレクトリ
+CLI_TEXTURE_WIDTH  = 270 # 既定のテクスチャ幅
+CLI_TEXTURE_HEIGHT = 90  # 既定のテクスチャ高さ
+CLI_TABLE_ANGLES = 90    # 反射率テーブルの入射角数(0-89度)
+POLARIZATIONS = {'p': P_POLARIZED, 's': S_POLARIZED, 'unpolarized': UNPOLARIZED}
+
+
+def split_layers(spec):
+    """
+    薄膜構成の文字列を括弧の外側の'/'で分割
+
+    Parameters
+    ----------
+    spec : string
+        薄膜構成の文字列
+
+    Returns
+    -------
+    tokens : list of string
+        各層の文字列
+    """
+    tokens, depth, start = [], 0, 0
+    for i, ch in enumerate(spec):
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+            if depth < 0:
+                raise ValueError('unbalanced parentheses: ' + spec)
+        elif ch == '/' and depth == 0:
+            tokens.append(spec[start:i])
+            start = i + 1
+    if depth != 0:
+        raise ValueError('unbalanced parentheses: ' + spec)
+    tokens.append(spec[start:])
+    return [t.strip() for t in tokens]
+
+
+def parse_layer(token):
+    """
+    1層分の文字列から薄膜層を生成
+
+    Parameters
+    ----------
+    token : string
+        'eta[:d]'(etaは材質名または屈折率，dは膜厚nm)
+        または'(層/層/...)*繰り返し回数'の周期構造
+
+    Returns
+    -------
+    film : ThinFilm or PeriodicStack
+        薄膜層
+    """
+    if token.startswith('('):
+        cell, _, repeat = token[1:].rpartition(')')
+        repeat = repeat.strip()
+        if not repeat.startswith('*'):
+            raise ValueError('periodic stack needs a repeat count: ' + token)
+        return PeriodicStack([parse_layer(t) for t in split_layers(cell)], int(repeat[1:]))
+    eta, _, d = token.partition(':')
+    d = float(d) if d else 0.0
+    if eta in MATERIALS:
+        return get_material(eta).film(d)
+    try:
+        n = complex(eta.replace('i', 'j'))
+    except ValueError:
+        raise ValueError('unknown material or index: ' + eta) from None
+    return ThinFilm(d, Spectrum(constv=n.real if n.imag == 0 else n))
+
+
+def parse_stack(spec):
+    """
+    薄膜構成の文字列から薄膜層の配列を生成
+
+    Parameters
+    ----------
+    spec : string
+        入射媒質から順に'/'で区切った層(例: 'air/1.34:500/1.0'，'air/(1.9:60/1.46:90)*4/BK7')
+
+    Returns
+    -------
+    films : list of ThinFilm or PeriodicStack
+        薄膜層の配列(先頭は入射媒質，末尾はベース層)
+    """
+    films = [parse_layer(t) for t in split_layers(spec)]
+    if len(films) < 2:
+        raise ValueError('stack needs an incident medium and a base layer: ' + spec)
+    return films
+
+
+def read_stack_file(path):
+    """
+    薄膜構成の一覧ファイルを読み込む
+
+    Parameters
+    ----------
+    path : string
+        1行に'[名前] 薄膜構成'を記述したファイル('#'以降は無視)
+
+    Returns
+    -------
+    stacks : list of tuple
+        (名前またはNone, 薄膜構成)の配列
+    """
+    stacks = []
+    with open(path) as f:
+        for line in f:
+            fields = line.split('#', 1)[0].split()
+            if len(fields) == 1:
+                stacks.append((None, fields[0]))
+            elif len(fields) == 2:
+                stacks.append((fields[0], fields[1]))
+            elif fields:
+                raise ValueError('invalid line in {}: {}'.format(path, line.rstrip()))
+    return stacks
+
+
+def write_png(path, rgb):
+    """
+    リニアなRGB値をsRGBの8bit PNGとして保存
+
+    Parameters
+    ----------
+    path : string
+        出力ファイル名
+    rgb : ndarray
+        リニアなRGB値(形状は(高さ, 幅, 3))
+    """
+    from PIL import Image # GUIを使わない処理でもPNG出力時のみ読み込む
+    Image.fromarray(srgb_quantize(rgb, 8)).save(path)
+
+
+def render_stack(job):
+    """
+    1つの薄膜構成について指定されたファイルを出力
+
+    Parameters
+    ----------
+    job : tuple
+        (名前, 薄膜構成, オプションの辞書)
+
+    Returns
+    -------
+    paths : list of string
+        出力したファイル名
+
+    Notes
+    -----
+    ワーカープロセスで実行するためモジュールの関数とし，引数は文字列と数値のみとする
+    """
+    name, spec, options = job
+    irid = Irid(parse_stack(spec))
+    illuminant = get_illuminant(options['illuminant'])
+    polarized = POLARIZATIONS[options['polarized']]
+    base = os.path.join(options['out'], name)
+    paths = []
+    if options['png']:
+        img = irid.create_texture(options['width'], options['height'],
+                                  adaptive=options['adaptive'], illuminant=illuminant)
+        write_png(base + '.png', img)
+        paths.append(base + '.png')
+    cos_array = np.cos(np.pi/180 * np.arange(CLI_TABLE_ANGLES))
+    if options['csv']:
+        # create_csvと同じ形式(入射角0-89度のRGB反射率)
+        rgb = irid.evaluate_colour(cos_array, polarized, adaptive=options['adaptive'],
+                                   illuminant=illuminant).filled(0.0)
+        np.savetxt(base + '.csv', np.clip(rgb, 0.0, 1.0), delimiter=',', fmt='%.4f')
+        paths.append(base + '.csv')
+    if options['spectral']:
+        v = irid.evaluate_angles(cos_array, polarized, adaptive=options['adaptive']).filled(0.0)
+        header = ','.join('{:g}'.format(wl) for wl in irid.grid.wavelength)
+        np.savetxt(base + '_spectrum.csv', v, delimiter=',', fmt='%.6f', header=header)
+        paths.append(base + '_spectrum.csv')
+    return paths
+
+
+def report_results(jobs, results):
+    """
+    出力したファイルを薄膜構成ごとに表示
+
+    Parameters
+    ----------
+    jobs : list of tuple
+        (名前, 薄膜構成, オプションの辞書)の配列
+    results : iterable
+        各薄膜構成のrender_stackの結果
+    """
+    for (name, spec, _), paths in zip(jobs, results):
+        print('{}: {} -> {}'.format(name, spec, ', '.join(paths)))
+
+
+def create_parser():
+    """
+    コマンドライン引数の解析器を生成
+
+    Returns
+    -------
+    parser : ArgumentParser
+        引数の解析器
+    """
+    parser = argparse.ArgumentParser(
+        description='薄膜干渉のテクスチャと反射率テーブルをGUIなしで出力',
+        epilog="薄膜構成の例: 'air/1.34:500/1.0'，'air/(1.9:60/1.46:90)*4/BK7'")
+    parser.add_argument('stacks', nargs='*', metavar='STACK',
+                        help='薄膜構成(入射媒質から順に材質名または屈折率[:膜厚nm]を/で区切る)')
+    parser.add_argument('-f', '--file', action='append', default=[],
+                        help='薄膜構成の一覧ファイル(1行に[名前] 薄膜構成)')
+    parser.add_argument('-o', '--out', default=CLI_OUTPUT_DIR, help='出力ディレクトリ')
+    parser.add_argument('--png', action='store_true', help='テクスチャをPNGで出力(既定)')
+    parser.add_argument('--csv', action='store_true', help='入射角0-89度のRGB反射率テーブルを出力')
+    parser.add_argument('--spectral', action='store_true', help='入射角0-89度の分光反射率テーブルを出力')
+    parser.add_argument('--width', type=int, default=CLI_TEXTURE_WIDTH, help='テクスチャ幅')
+    parser.add_argument('--height', type=int, default=CLI_TEXTURE_HEIGHT, help='テクスチャ高さ')
+    parser.add_argument('--illuminant', default='E', choices=sorted(ILLUMINANTS), help='光源')
+    parser.add_argument('--polarized', default='unpolarized', choices=sorted(POLARIZATIONS),
+                        help='反射率テーブルの偏光状態')
+    parser.add_argument('--adaptive', action='store_true', help='干渉縞に応じて波長帯を分割して平均')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='並列プロセス数(既定はCPU数)')
+    return parser
+
+
+def main(argv=None):
+    """
+    コマンドラインから実行
+
+    Parameters
+    ----------
+    argv : list of string
+        コマンドライン引数(省略時はsys.argv)
+
+    Returns
+    -------
+    status : int
+        終了コード
+    """
+    parser = create_parser()
+    args = parser.parse_args(argv)
+    stacks = [(None, spec) for spec in args.stacks]
+    try:
+        for path in args.file:
+            stacks += read_stack_file(path)
+        for _, spec in stacks:
+            parse_stack(spec) # 実行前に構文を確認
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if not stacks:
+        parser.error('no stacks given')
+    options = {'out': args.out, 'png': args.png or not (args.csv or args.spectral),
+               'csv': args.csv, 'spectral': args.spectral,
+               'width': args.width, 'height': args.height,
+               'illuminant': args.illuminant, 'polarized': args.polarized,
+               'adaptive': args.adaptive}
+    width = len(str(len(stacks) - 1))
+    jobs = [(name or 'stack{:0{}d}'.format(i, width), spec, options)
+            for i, (name, spec) in enumerate(stacks)]
+    os.makedirs(args.out, exist_ok=True)
+    n_jobs = max(1, min(args.jobs, len(jobs)))
+    if n_jobs == 1:
+        report_results(jobs, map(render_stack, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            report_results(jobs, executor.map(render_stack, jobs,
+                                              chunksize=max(1, len(jobs) // (4 * n_jobs))))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,6 @@
 import os
+import threading
+from cache import *
 from spectrum import *
 from utility import *
 
@@ -6,6 +8,112 @@ from utility import *
 P_POLARIZED = 1 # p偏光
 S_POLARIZED = 2 # s偏光
 UNPOLARIZED = 3 # 無偏光
+PHYSICS_VERSION = 2 # 計算結果が変わる変更をした場合に更新(ディスクキャッシュを無効化)
+ADAPTIVE_MAX_PHASE  = np.pi / 2 # 適応サンプリングで許容する1サンプルあたりの位相差の変化
+ADAPTIVE_MAX_FACTOR = 64        # 適応サンプリングの1波長帯あたりの最大サンプル数(2の累乗)
+ADAPTIVE_COLOUR_EPS = 1e-6      # 色計算で分割する波長帯の等色関数の最大値に対する下限
+QUADRATURE_MIN_NODES  = 9    # 色計算の求積点の最小数
+QUADRATURE_NODE_PHASE = 5.0  # 求積点1つあたりに許容する可視域での位相差の変化(高調波を含む)
+QUADRATURE_NODE_STEP  = 4    # 求積点の数の刻み(求積表の種類を抑えるため)
+QUADRATURE_HARMONIC_EPS = 1e-4 # 多重反射の高調波を打ち切る振幅
+
+_disk_cache = None # 計算結果のディスクキャッシュ
+
+
+def set_disk_cache(directory, max_bytes=DISK_CACHE_MAX_BYTES):
+    """
+    計算結果のディスクキャッシュを設定
+
+    Parameters
+    ----------
+    directory : string
+        キャッシュディレクトリ(Noneの場合は使用しない)
+    max_bytes : int
+        保持するファイルの合計バイト数の上限
+    """
+    global _disk_cache
+    if directory is None:
+        _disk_cache = None
+    else:
+        _disk_cache = DiskCache(directory, PHYSICS_VERSION, max_bytes)
+
+
+def get_disk_cache():
+    """
+    計算結果のディスクキャッシュを取得
+
+    Returns
+    -------
+    cache : DiskCache
+        ディスクキャッシュ(使用しない場合はNone)
+    """
+    return _disk_cache
+
+
+class Workspace:
+    """
+    計算用の作業バッファを保持するクラス
+
+    Attributes
+    ----------
+    __buffers : dict
+        名前ごとの作業バッファ
+
+    Notes
+    -----
+    同じ名前のバッファは必要な大きさを超えない限り再利用される
+    """
+
+    def __init__(self):
+        """初期化"""
+        self.__buffers = {}
+
+    def get(self, name, shape, dtype=np.complex128):
+        """
+        作業バッファを取得
+
+        Parameters
+        ----------
+        name : string
+            バッファの名前
+        shape : tuple of int
+            配列の形状
+        dtype : dtype
+            配列の型
+
+        Returns
+        -------
+        buf : ndarray
+            作業バッファ(値は未初期化)
+        """
+        size = int(np.prod(shape))
+        buf = self.__buffers.get(name)
+        if buf is None or buf.size < size or buf.dtype != dtype:
+            buf = np.empty(size, dtype=dtype)
+            self.__buffers[name] = buf
+        return buf[:size].reshape(shape)
+
+    def clear(self):
+        """作業バッファを解放"""
+        self.__buffers.clear()
+
+
+_local = threading.local() # スレッドごとの作業バッファ
+
+
+def get_workspace():
+    """
+    スレッドごとの既定の作業バッファを取得
+
+    Returns
+    -------
+    work : Workspace
+        作業バッファ
+    """
+    if not hasattr(_local, 'workspace'):
+        _local.workspace = Workspace()
+    return _local.workspace
+
 
 def fresnel_rp(cos0, cos1, n0, n1):
     """
@@ -58,7 +166,7 @@ def fresnel_tp(cos0, cos1, n0, n1):
     n1 : float
         屈折方向の媒質の屈折率
     """
-    return (2*n0*cos0) / (n1*cos0 + n1*cos1)
+    return (2*n0*cos0) / (n1*cos0 + n0*cos1)
 
 
 def fresnel_ts(cos0, cos1, n0, n1):
@@ -113,6 +221,296 @@ def irid_r(r01, r10, r12, t01, t10, phi):
     return r
 
 
+def refraction_cos(sin_in, eta_in, eta):
+    """
+    スネルの法則から屈折角余弦を計算
+
+    Parameters
+    ----------
+    sin_in : float or ndarray
+        入射角正弦
+    eta_in : ndarray
+        入射媒質の屈折率
+    eta : ndarray
+        屈折方向の媒質の屈折率
+
+    Returns
+    -------
+    cos_theta : ndarray
+        屈折角余弦(複素数)
+
+    Notes
+    -----
+    引数はブロードキャスト可能であればよい
+    全反射や吸収媒質では屈折角余弦は複素数となり，
+    媒質中で減衰する側(Im(eta*cos) >= 0)の分枝を選ぶ
+    """
+    sin_theta = eta_in * sin_in / eta
+    cos_theta = np.sqrt(1. - sin_theta**2 + 0.j)
+    return np.where((eta * cos_theta).imag < 0, -cos_theta, cos_theta)
+
+
+def layer_cos(eta, cos_array):
+    """
+    複数の入射角について各層での屈折角余弦を計算
+
+    Parameters
+    ----------
+    eta : ndarray
+        各層の屈折率(形状は(層数, 波長サンプル数))
+    cos_array : ndarray
+        入射角余弦の配列
+
+    Returns
+    -------
+    cos_theta : ndarray
+        各層での屈折角余弦(形状は(層数, 入射角数, 波長サンプル数))
+    """
+    cos_in = np.asarray(cos_array, dtype=float).reshape(-1, 1)
+    sin_in = np.sqrt(np.maximum(0, 1 - cos_in**2))
+    return refraction_cos(sin_in, eta[0], eta[:, np.newaxis, :])
+
+
+def irid_coefficient(cos0, cos1, cos2, n0, n1, n2, d, wl, work=None):
+    """
+    単層薄膜の干渉を考慮した反射係数を全波長で一括計算
+
+    Parameters
+    ----------
+    cos0 : ndarray
+        入射媒質での入射角余弦
+    cos1 : ndarray
+        薄膜での屈折角余弦
+    cos2 : ndarray
+        出射媒質での屈折角余弦
+    n0 : ndarray
+        入射媒質の屈折率
+    n1 : ndarray
+        薄膜の屈折率
+    n2 : ndarray
+        出射媒質の屈折率
+    d : float
+        薄膜の膜厚
+    wl : ndarray
+        波長
+    work : Workspace
+        作業バッファ(省略時はスレッドごとの既定のバッファ)
+
+    Returns
+    -------
+    rp : ndarray
+        p偏光の反射係数
+    rs : ndarray
+        s偏光の反射係数
+
+    Notes
+    -----
+    引数はブロードキャスト可能であればよい
+    t01*t10 = 1 - r01**2，r10 = -r01 からirid_rを
+    (r01 + r12*exp(i*phi)) / (1 + r01*r12*exp(i*phi)) の形で計算
+    位相項以降の計算は作業バッファ上で行う
+    """
+    if work is None:
+        work = get_workspace()
+    shape = np.broadcast_shapes(*(np.shape(a) for a in (cos0, cos1, cos2, n0, n1, n2, d, wl)))
+    # 位相項
+    e = work.get('phase', shape)
+    np.multiply(n1, cos1, out=e)
+    np.multiply(e, 4.j * np.pi * np.divide(d, wl), out=e)
+    np.exp(e, out=e)
+    t = work.get('term', shape)
+    r = []
+    for fresnel in (fresnel_rp, fresnel_rs):
+        r01 = fresnel(cos0, cos1, n0, n1)
+        r12 = fresnel(cos1, cos2, n1, n2)
+        v = np.empty(shape, dtype=complex)
+        np.multiply(r12, e, out=t)
+        np.add(r01, t, out=v) # 分子
+        np.multiply(t, r01, out=t)
+        np.add(t, 1, out=t)   # 分母
+        np.divide(v, t, out=v)
+        r.append(v)
+    return r[0], r[1]
+
+
+def layer_matrix(eta, cos_theta, d, wl, admittance, out=None):
+    """
+    薄膜層の特性行列を計算
+
+    Parameters
+    ----------
+    eta : ndarray
+        薄膜の屈折率
+    cos_theta : ndarray
+        薄膜での屈折角余弦
+    d : float
+        薄膜の膜厚
+    wl : ndarray
+        波長
+    admittance : ndarray
+        薄膜の光学アドミタンス
+    out : ndarray
+        結果を書き込む配列
+
+    Returns
+    -------
+    m : ndarray
+        特性行列(形状は(..., 2, 2))
+
+    Notes
+    -----
+    位相の符号はirid_rと同じくexp(+i*phi)の規約
+    """
+    delta = 2 * np.pi * d / wl * eta * cos_theta # 片道の位相差
+    delta = np.broadcast_to(delta, np.broadcast(delta, admittance).shape)
+    cos_delta = np.cos(delta)
+    sin_delta = np.sin(delta)
+    m = np.empty(delta.shape + (2, 2), dtype=complex) if out is None else out
+    m[..., 0, 0] = cos_delta
+    m[..., 0, 1] = -1.j * sin_delta / admittance
+    m[..., 1, 0] = -1.j * sin_delta * admittance
+    m[..., 1, 1] = cos_delta
+    return m
+
+
+def matrix_power(m, n):
+    """
+    特性行列のn乗を二乗の繰り返しにより計算
+
+    Parameters
+    ----------
+    m : ndarray
+        特性行列(形状は(..., 2, 2))
+    n : int
+        指数
+
+    Returns
+    -------
+    mn : ndarray
+        特性行列のn乗(定数倍を除く)
+
+    Notes
+    -----
+    行列積はlog2(n)回程度
+    阻止帯域で要素が指数的に増大してもオーバーフローしないよう，
+    積ごとに要素の最大値で正規化する
+    反射係数は特性行列の定数倍に依存しないため結果には影響しない
+    """
+    def normalize(a):
+        return a / np.max(np.abs(a), axis=(-2, -1), keepdims=True)
+
+    mn = None
+    while n > 0:
+        if n & 1:
+            mn = m if mn is None else normalize(mn @ m)
+        n >>= 1
+        if n > 0:
+            m = normalize(m @ m)
+    if mn is None: # 0乗
+        mn = np.broadcast_to(np.eye(2, dtype=complex), m.shape)
+    return mn
+
+
+def transfer_matrix_coefficient(cos_theta, eta, d, wl, periods=(), work=None):
+    """
+    特性行列法により多層膜の反射係数を計算
+
+    Parameters
+    ----------
+    cos_theta : ndarray
+        各層での屈折角余弦(形状は(層数, ...))
+    eta : ndarray
+        各層の屈折率(形状は(層数, ...))
+    d : list of float
+        各層の膜厚(先頭と末尾の媒質の膜厚は無視)
+    wl : ndarray
+        波長
+    periods : list of tuple
+        周期構造の(単位胞の先頭の層番号, 末尾の層番号+1, 繰り返し回数)
+    work : Workspace
+        作業バッファ(省略時はスレッドごとの既定のバッファ)
+
+    Returns
+    -------
+    rp : ndarray
+        p偏光の反射係数
+    rs : ndarray
+        s偏光の反射係数
+
+    Notes
+    -----
+    p偏光とs偏光をまとめて2x2行列積を層数回だけ計算
+    周期構造は単位胞の特性行列を繰り返し回数乗して計算
+    アドミタンスはs偏光でn*cos，p偏光でcos/nとし，
+    反射係数の符号をfresnel_rp，fresnel_rsと揃えている
+    Reference: [Macleod 2010] Chapter 2
+    """
+    if work is None:
+        work = get_workspace()
+    # 各層のアドミタンス(先頭の軸がp偏光とs偏光)
+    y = np.stack(np.broadcast_arrays(cos_theta / eta, eta * cos_theta))
+    shape = (2,) + y.shape[2:] + (2, 2)
+    identity = np.broadcast_to(np.eye(2, dtype=complex), shape)
+    if any(stop <= start for start, stop, _ in periods):
+        raise ValueError('periodic stack cell must not be empty: {}'.format(periods))
+    periods = {start: (stop, repeat) for start, stop, repeat in periods}
+
+    def multiply(a, k, names):
+        # 層kの特性行列を右から掛ける(結果は作業バッファを交互に使用)
+        lm = layer_matrix(eta[k], cos_theta[k], d[k], wl, y[:, k],
+                          out=work.get('layer', shape))
+        out = work.get(names[0], shape)
+        if np.may_share_memory(a, out):
+            out = work.get(names[1], shape)
+        return np.matmul(a, lm, out=out)
+
+    m = identity
+    j = 1
+    while j < len(d) - 1:
+        if j in periods: # 周期構造
+            stop, repeat = periods[j]
+            cell = identity
+            for k in range(j, stop):
+                cell = multiply(cell, k, ('cell0', 'cell1'))
+            m = m @ matrix_power(cell, repeat)
+            j = stop
+        else:
+            m = multiply(m, j, ('matrix0', 'matrix1'))
+            j = j + 1
+    # 基板のアドミタンスから多層膜全体の等価アドミタンスを計算
+    b = m[..., 0, 0] + m[..., 0, 1] * y[:, -1]
+    c = m[..., 1, 0] + m[..., 1, 1] * y[:, -1]
+    r = (y[:, 0] * b - c) / (y[:, 0] * b + c)
+    return r[0], r[1]
+
+
+def polarized_reflectance(rp, rs, polarized=UNPOLARIZED):
+    """
+    偏光状態に応じて反射係数から反射率を計算
+
+    Parameters
+    ----------
+    rp : ndarray
+        p偏光の反射係数
+    rs : ndarray
+        s偏光の反射係数
+    polarized : int
+        偏光状態
+
+    Returns
+    -------
+    v : ndarray
+        反射率
+    """
+    if polarized == UNPOLARIZED:
+        return (np.abs(rp) ** 2 + np.abs(rs) ** 2) / 2
+    elif polarized == P_POLARIZED:
+        return np.abs(rp) ** 2
+    elif polarized == S_POLARIZED:
+        return np.abs(rs) ** 2
+    return np.zeros(np.broadcast(rp, rs).shape)
+
+
 
 class ThinFilm:
     """
@@ -149,26 +547,914 @@ class ThinFilm:
         return self.__eta
 
 
+class PeriodicStack:
+    """
+    周期構造(単位胞の繰り返し)を表現するクラス
+
+    Attributes
+    ----------
+    __cell : list of ThinFilm
+        単位胞を構成する薄膜層の配列
+    __repeat : int
+        繰り返し回数
+    """
+
+    def __init__(self, cell, repeat):
+        """
+        初期化
+
+        Parameters
+        ----------
+        cell : list of ThinFilm
+            単位胞を構成する薄膜層の配列
+        repeat : int
+            繰り返し回数
+        """
+        if repeat < 0:
+            raise ValueError('repeat must be non-negative')
+        if len(cell) == 0:
+            raise ValueError('periodic stack needs at least one layer in its cell')
+        self.__cell = list(cell)
+        self.__repeat = int(repeat)
+
+    @property
+    def cell(self):
+        return self.__cell
+
+    @property
+    def repeat(self):
+        return self.__repeat
+
+    @property
+    def d(self):
+        return self.__repeat * sum(film.d for film in self.__cell)
+
+
+def flatten_films(films):
+    """
+    周期構造を含む薄膜層の配列を単位胞の層を並べた配列に変換
+
+    Parameters
+    ----------
+    films : list of ThinFilm or PeriodicStack
+        薄膜層の配列
+
+    Returns
+    -------
+    layers : list of ThinFilm
+        薄膜層の配列(周期構造は単位胞1つ分)
+    periods : list of tuple
+        周期構造の(単位胞の先頭の層番号, 末尾の層番号+1, 繰り返し回数)
+    """
+    if isinstance(films[0], PeriodicStack) or isinstance(films[-1], PeriodicStack):
+        raise ValueError('incident and exit media must be ThinFilm')
+    layers = []
+    periods = []
+    for film in films:
+        if isinstance(film, PeriodicStack):
+            periods.append((len(layers), len(layers) + len(film.cell), film.repeat))
+            layers.extend(film.cell)
+        else:
+            layers.append(film)
+    return layers, periods
+
+
+def masked_reflectance(v):
+    """
+    計算できない入射角の行をマスクした読み取り専用の分光反射率を生成
+
+    Parameters
+    ----------
+    v : ndarray
+        分光反射率(形状は(入射角数, 波長サンプル数))
+
+    Returns
+    -------
+    v : MaskedArray
+        値が有限でない入射角の行をマスクした分光反射率
+    """
+    invalid = ~np.all(np.isfinite(v), axis=1) # 計算できない入射角
+    mask = np.repeat(invalid[:, np.newaxis], v.shape[1], axis=1)
+    v.setflags(write=False)
+    mask.setflags(write=False)
+    return np.ma.masked_array(v, mask=mask)
+
+
+class FilmStack:
+    """
+    変更不可でハッシュ可能な多層膜クラス
+
+    Attributes
+    ----------
+    __d : tuple of float
+        各層の膜厚
+    __eta : ndarray
+        各層の屈折率(形状は(層数, 波長サンプル数)，読み取り専用)
+    __periods : tuple of tuple
+        周期構造の(単位胞の先頭の層番号, 末尾の層番号+1, 繰り返し回数)
+    __grid : SpectralGrid
+        屈折率の波長サンプリング
+    __digest : string
+        構造から計算したハッシュ値
+
+    Notes
+    -----
+    生成時に屈折率を複製して読み取り専用にするため，
+    元のThinFilmやSpectrumを変更しても影響を受けない
+    状態を持たないため複数のスレッドから同時に評価してよい
+    屈折率の波長サンプリングが異なる層は指定した波長サンプリングに補間する
+    """
+
+    def __init__(self, films, grid=None):
+        """
+        初期化
+
+        Parameters
+        ----------
+        films : list of ThinFilm or PeriodicStack, or FilmStack
+            薄膜層の配列
+        grid : SpectralGrid
+            波長サンプリング(省略時は先頭の層の屈折率の波長サンプリング)
+        """
+        if isinstance(films, FilmStack):
+            d, periods = films.d, films.periods
+            grid = films.grid if grid is None else grid
+            if grid == films.grid:
+                eta = films.eta
+            else:
+                eta = np.array([Spectrum.from_array(c, grid=films.grid).resample(grid).c
+                                for c in films.eta])
+        else:
+            layers, periods = flatten_films(list(films))
+            if grid is None:
+                grid = layers[0].eta.grid if layers else DEFAULT_GRID
+            d = tuple(float(film.d) for film in layers)
+            eta = np.array([film.eta.resample(grid).c for film in layers])
+        eta.setflags(write=False)
+        self.__set(d, eta, tuple(periods), grid)
+
+    def __set(self, d, eta, periods, grid):
+        self.__d = d
+        self.__eta = eta
+        self.__periods = periods
+        self.__grid = grid
+        self.__digest = array_digest(d, eta, periods, grid.key)
+
+    @property
+    def d(self):
+        return self.__d
+
+    @property
+    def eta(self):
+        return self.__eta
+
+    @property
+    def periods(self):
+        return self.__periods
+
+    @property
+    def grid(self):
+        return self.__grid
+
+    @property
+    def digest(self):
+        return self.__digest
+
+    def __len__(self):
+        return len(self.__d)
+
+    def __hash__(self):
+        return hash(self.__digest)
+
+    def __eq__(self, other):
+        if not isinstance(other, FilmStack):
+            return NotImplemented
+        return (self.__digest == other.digest and self.__d == other.d
+                and self.__periods == other.periods and self.__grid == other.grid
+                and np.array_equal(self.__eta, other.eta))
+
+    def __repr__(self):
+        return 'FilmStack(d={}, periods={}, grid={})'.format(self.__d, self.__periods, self.__grid)
+
+    def with_thickness(self, d, index=1):
+        """
+        膜厚のみ異なる多層膜を生成
+
+        Parameters
+        ----------
+        d : float
+            膜厚
+        index : int
+            変更する層の番号(周期構造は単位胞の層を並べた番号)
+
+        Returns
+        -------
+        stack : FilmStack
+            新しい多層膜(屈折率の配列は共有)
+        """
+        thickness = list(self.__d)
+        thickness[index] = float(d)
+        stack = object.__new__(FilmStack)
+        stack.__set(tuple(thickness), self.__eta, self.__periods, self.__grid)
+        return stack
+
+    def with_eta(self, eta, index=1):
+        """
+        屈折率のみ異なる多層膜を生成
+
+        Parameters
+        ----------
+        eta : Spectrum or complex
+            屈折率
+        index : int
+            変更する層の番号(周期構造は単位胞の層を並べた番号)
+
+        Returns
+        -------
+        stack : FilmStack
+            新しい多層膜
+        """
+        value = eta.resample(self.__grid).c if isinstance(eta, Spectrum) else eta
+        array = np.array(self.__eta, dtype=np.result_type(self.__eta, np.asarray(value)))
+        array[index] = value
+        array.setflags(write=False)
+        stack = object.__new__(FilmStack)
+        stack.__set(self.__d, array, self.__periods, self.__grid)
+        return stack
+
+
+def as_stack(films, grid=None):
+    """
+    薄膜層の配列を多層膜に変換
+
+    Parameters
+    ----------
+    films : list of ThinFilm or PeriodicStack, or FilmStack
+        薄膜層の配列
+    grid : SpectralGrid
+        波長サンプリング(省略時は先頭の層の屈折率の波長サンプリング)
+
+    Returns
+    -------
+    stack : FilmStack
+        多層膜(波長サンプリングが一致するFilmStackが与えられた場合はそのまま返す)
+    """
+    if isinstance(films, FilmStack) and (grid is None or grid == films.grid):
+        return films
+    return FilmStack(films, grid)
+
+
+def stack_digest(films):
+    """
+    薄膜層の配列の正規化したハッシュ値を計算
+
+    Parameters
+    ----------
+    films : list of ThinFilm or PeriodicStack, or FilmStack
+        薄膜層の配列
+
+    Returns
+    -------
+    digest : string
+        膜厚と屈折率の配列および周期構造から計算したハッシュ値
+    """
+    return as_stack(films).digest
+
+
+def evaluate_stack(stack, cos_array, polarized=UNPOLARIZED, work=None):
+    """
+    多層膜の複数の入射角に対する分光反射率を計算
+
+    Parameters
+    ----------
+    stack : FilmStack
+        多層膜
+    cos_array : ndarray
+        入射角余弦の配列
+    polarized : int
+        偏光状態
+    work : Workspace
+        作業バッファ(省略時はスレッドごとの既定のバッファ)
+
+    Returns
+    -------
+    v : MaskedArray
+        分光反射率(形状は(入射角数, 波長サンプル数)，読み取り専用)
+
+    Notes
+    -----
+    波長サンプリングは多層膜の波長サンプリング
+    3層(単層薄膜)の場合は等比数列の和による式を，
+    それ以外の場合は特性行列法を使用
+    計算できない(値が有限でない)入射角の行はマスクされる
+    引数以外の状態を変更しないため複数のスレッドから同時に呼び出してよい
+    """
+    eta = np.asarray(stack.eta, dtype=complex) # 各層の屈折率
+    v = stack_reflectance(stack, eta, stack.grid.wavelength, cos_array, polarized, work)
+    return masked_reflectance(v)
+
+
+def stack_reflectance(stack, eta, wl, cos_array, polarized=UNPOLARIZED, work=None):
+    """
+    任意の波長における多層膜の分光反射率を計算
+
+    Parameters
+    ----------
+    stack : FilmStack
+        多層膜(膜厚と周期構造のみ使用)
+    eta : ndarray
+        各層の屈折率(形状は(層数, 波長数))
+    wl : ndarray
+        波長
+    cos_array : ndarray
+        入射角余弦の配列
+    polarized : int
+        偏光状態
+    work : Workspace
+        作業バッファ(省略時はスレッドごとの既定のバッファ)
+
+    Returns
+    -------
+    v : ndarray
+        分光反射率(形状は(入射角数, 波長数))
+    """
+    # 各層への入射角余弦を計算
+    cos_theta = layer_cos(eta, cos_array)
+    eta = eta[:, np.newaxis, :]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if len(stack) == 3 and not stack.periods:
+            rp, rs = irid_coefficient(cos_theta[0], cos_theta[1], cos_theta[2],
+                                      eta[0], eta[1], eta[2], stack.d[1], wl, work)
+        else:
+            rp, rs = transfer_matrix_coefficient(cos_theta, eta, stack.d, wl,
+                                                 stack.periods, work)
+    return polarized_reflectance(rp, rs, polarized)
+
+
+def refinement_factors(stack, cos_array, max_phase=ADAPTIVE_MAX_PHASE,
+                       max_factor=ADAPTIVE_MAX_FACTOR):
+    """
+    干渉縞の周波数から各波長帯に必要なサンプル数を推定
+
+    Parameters
+    ----------
+    stack : FilmStack
+        多層膜
+    cos_array : ndarray
+        入射角余弦の配列
+    max_phase : float
+        許容する1サンプルあたりの位相差の変化
+    max_factor : int
+        1波長帯あたりの最大サンプル数(2の累乗)
+
+    Returns
+    -------
+    m : ndarray
+        各入射角と波長帯のサンプル数(形状は(入射角数, 波長サンプル数)，1以上の2の累乗)
+
+    Notes
+    -----
+    位相差φ = 4π d n cosθ / λの波長帯内での変化量
+    |dφ/dλ| Δλ = 4π Σ d n cosθ Δλ / λ^2 に多重反射の高調波の次数(reflection_harmonics)を
+    掛けた値がmax_phase以下になるように波長帯を分割する
+    周期構造の層は繰り返し回数分の膜厚として数える
+    サンプル数を2の累乗に切り上げ，分割した波長が最大のサンプル数で等分割した
+    波長サンプリングの区間の中心と一致するようにする
+    """
+    grid = stack.grid
+    eta = np.asarray(stack.eta, dtype=complex)
+    cos_theta = layer_cos(eta, np.asarray(cos_array, dtype=float))
+    thickness = np.array(stack.d, dtype=float)
+    for start, end, repeat in stack.periods:
+        thickness[start:end] *= repeat
+    thickness[0] = thickness[-1] = 0.0
+    # 入射角ごとの光路長と高調波の次数
+    path = np.tensordot(thickness, np.abs((eta[:, np.newaxis, :] * cos_theta).real), axes=1)
+    harmonic = reflection_harmonics(eta, cos_theta)
+    with np.errstate(invalid='ignore'):
+        phase = 4 * np.pi * path * harmonic[:, np.newaxis] * grid.step / grid.wavelength**2
+    # 光路長が0の場合は干渉しない
+    phase = np.nan_to_num(phase, nan=0.0, posinf=np.inf)
+    m = np.clip(np.ceil(phase / max_phase), 1, max_factor)
+    return (2 ** np.ceil(np.log2(m))).astype(int)
+
+
+def reflection_harmonics(eta, cos_theta):
+    """
+    多重反射による反射率の高調波の次数を入射角ごとに推定
+
+    Parameters
+    ----------
+    eta : ndarray
+        各層の屈折率(形状は(層数, 波長数))
+    cos_theta : ndarray
+        各層への入射角余弦(形状は(層数, 入射角数, 波長数))
+
+    Returns
+    -------
+    harmonic : ndarray
+        各入射角の高調波の次数(1以上，多重反射が減衰しない場合はinf)
+
+    Notes
+    -----
+    反射率は位相差φの周期関数で，k次の高調波の振幅は多重反射の往復の振幅ρ^kで減衰する
+    振幅がQUADRATURE_HARMONIC_EPSを下回るまでの次数を返す
+    ρは反射係数の絶対値が大きい2つの界面の積の与えた波長での最大値で見積もる
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r = np.array([np.max(np.maximum(np.abs(fresnel_rp(c0, c1, n0, n1)),
+                                        np.abs(fresnel_rs(c0, c1, n0, n1))), axis=1)
+                      for c0, c1, n0, n1 in zip(cos_theta[:-1], cos_theta[1:],
+                                                eta[:-1, np.newaxis], eta[1:, np.newaxis])])
+        r = np.sort(r, axis=0)
+        rho = r[-1] * r[-2] if len(r) >= 2 else np.zeros(cos_theta.shape[1])
+        harmonic = np.ceil(np.log(QUADRATURE_HARMONIC_EPS) / np.log(np.minimum(rho, 1.0)))
+    harmonic = np.where(rho < 1.0, harmonic, np.inf)
+    return np.where(rho < QUADRATURE_HARMONIC_EPS, 1.0, harmonic)
+
+
+def evaluate_stack_samples(stack, cos_array, m, polarized=UNPOLARIZED, work=None):
+    """
+    各波長帯を指定した数に等分割した波長で多層膜の反射率を計算
+
+    Parameters
+    ----------
+    stack : FilmStack
+        多層膜
+    cos_array : ndarray
+        入射角余弦の配列
+    m : ndarray
+        各波長帯のサンプル数
+    polarized : int
+        偏光状態
+    work : Workspace
+        作業バッファ(省略時はスレッドごとの既定のバッファ)
+
+    Returns
+    -------
+    v : ndarray
+        分光反射率(形状は(入射角数, サンプル数の合計)，波長帯の順に並ぶ)
+
+    Notes
+    -----
+    屈折率は中心波長の値から線形補間する
+    """
+    grid = stack.grid
+    offsets = np.concatenate(([0], np.cumsum(m)[:-1]))
+    band = np.repeat(np.arange(grid.n), m) # 各サンプルが属する波長帯
+    sub = np.arange(len(band)) - offsets[band]
+    wl = grid.start + grid.step * (band + (sub + 0.5) / m[band])
+    eta = np.array([np.interp(wl, grid.wavelength, e)
+                    for e in np.asarray(stack.eta, dtype=complex)])
+    return stack_reflectance(stack, eta, wl, cos_array, polarized, work)
+
+
+def evaluate_stack_adaptive(stack, cos_array, polarized=UNPOLARIZED, work=None,
+                            max_phase=ADAPTIVE_MAX_PHASE, max_factor=ADAPTIVE_MAX_FACTOR):
+    """
+    干渉縞に応じて波長サンプリングを細かくした分光反射率を計算
+
+    Parameters
+    ----------
+    stack : FilmStack
+        多層膜
+    cos_array : ndarray
+        入射角余弦の配列
+    polarized : int
+        偏光状態
+    work : Workspace
+        作業バッファ(省略時はスレッドごとの既定のバッファ)
+    max_phase : float
+        許容する1サンプルあたりの位相差の変化
+    max_factor : int
+        1波長帯あたりの最大サンプル数(2の累乗)
+
+    Returns
+    -------
+    v : MaskedArray
+        各波長帯の平均の分光反射率(形状は(入射角数, 波長サンプル数)，読み取り専用)
+
+    Notes
+    -----
+    refinement_factorsで推定した全ての入射角でのサンプル数の最大値で必要な波長帯のみを等分割し，
+    分割した中心波長で計算した反射率を波長帯ごとに平均する
+    分割が不要な場合はevaluate_stackと同じ結果になる
+    色の計算では平均した反射率に中心波長の等色関数を掛けると誤差が大きいため，
+    evaluate_stack_colourは分割したサンプルごとの等色関数で積分する
+    """
+    m = np.max(refinement_factors(stack, cos_array, max_phase, max_factor), axis=0, initial=1)
+    if np.all(m == 1):
+        return evaluate_stack(stack, cos_array, polarized, work)
+    v = evaluate_stack_samples(stack, cos_array, m, polarized, work)
+    offsets = np.concatenate(([0], np.cumsum(m)[:-1]))
+    v = np.add.reduceat(v, offsets, axis=-1) / m
+    return masked_reflectance(v)
+
+
+def refined_colour_matrix(grid, m, illuminant=None, rgb=True):
+    """
+    波長帯を分割したサンプルの反射率から色への変換行列を取得
+
+    Parameters
+    ----------
+    grid : SpectralGrid
+        波長サンプリング
+    m : ndarray
+        各波長帯のサンプル数(2の累乗)
+    illuminant : Illuminant
+        光源(省略時は等エネルギー白色光源)
+    rgb : bool
+        Trueの場合はRGB値，Falseの場合はXYZ三刺激値への変換行列
+
+    Returns
+    -------
+    w : ndarray
+        変換行列(形状は(サンプル数の合計, 3))
+
+    Notes
+    -----
+    最大のサンプル数で等分割した波長サンプリングの変換行列を各サンプルの区間ごとに合計し，
+    サンプルごとに自身の区間の等色関数と光源で重み付けする
+    """
+    top = int(np.max(m))
+    if top == 1:
+        return colour_matrix(grid, illuminant, rgb)
+    fine = colour_matrix(SpectralGrid(grid.start, grid.end, grid.n * top), illuminant, rgb)
+    fine = fine.reshape(grid.n, top, 3)
+    offsets = np.concatenate(([0], np.cumsum(m)[:-1]))
+    w = np.empty((int(np.sum(m)), 3))
+    for k in np.unique(m):
+        bands = np.flatnonzero(m == k)
+        w[offsets[bands, np.newaxis] + np.arange(k)] = \
+            fine[bands].reshape(len(bands), k, top // k, 3).sum(axis=2)
+    return w
+
+
+def quadrature_nodes(stack, cos_array):
+    """
+    色計算に必要な求積点の数を入射角ごとに推定
+
+    Parameters
+    ----------
+    stack : FilmStack
+        多層膜
+    cos_array : ndarray
+        入射角余弦の配列
+
+    Returns
+    -------
+    n : ndarray
+        各入射角の求積点の数(全波長で計算した方が少ない場合は0)
+
+    Notes
+    -----
+    反射率は位相差φの周期関数で，k次の高調波の振幅は多重反射の往復の振幅ρ^kで減衰する
+    可視域全体での位相差の変化 4π Σ d n cosθ (1/λmin - 1/λmax) に
+    振幅がQUADRATURE_HARMONIC_EPSを下回るまでの高調波の次数(reflection_harmonics)を
+    掛けた値に比例して増やす
+    光路長と反射係数は最小の求積点の波長での最大値を使用
+    """
+    grid = stack.grid
+    wl = grid.quadrature(QUADRATURE_MIN_NODES)[0]
+    lo, hi = wl[0], wl[-1]
+    visible = (grid.wavelength >= lo) & (grid.wavelength <= hi)
+    # 最小の求積点で評価
+    eta = np.array([np.interp(wl, grid.wavelength, e)
+                    for e in np.asarray(stack.eta, dtype=complex)])
+    cos_theta = layer_cos(eta, np.asarray(cos_array, dtype=float))
+    # 可視域全体での位相差の変化
+    thickness = np.array(stack.d, dtype=float)
+    for start, end, repeat in stack.periods:
+        thickness[start:end] *= repeat
+    thickness[0] = thickness[-1] = 0.0
+    path = np.max(np.abs((eta[:, np.newaxis, :] * cos_theta).real), axis=2)
+    phase = 4 * np.pi * (thickness @ path) * (1 / lo - 1 / hi)
+    # 多重反射の高調波を含めた位相差の変化
+    with np.errstate(invalid='ignore'):
+        n = QUADRATURE_MIN_NODES + np.ceil(phase * reflection_harmonics(eta, cos_theta)
+                                           / QUADRATURE_NODE_PHASE)
+    n = (np.ceil((n - 1) / QUADRATURE_NODE_STEP) * QUADRATURE_NODE_STEP + 1)
+    n[~np.isfinite(n) | (n >= np.count_nonzero(visible))] = 0
+    return n.astype(int)
+
+
+def evaluate_stack_nodes(stack, cos_array, polarized=UNPOLARIZED, work=None, adaptive=False):
+    """
+    色計算に必要な波長でのみ多層膜の反射率を計算
+
+    Parameters
+    ----------
+    stack : FilmStack
+        多層膜
+    cos_array : ndarray
+        入射角余弦の配列
+    polarized : int
+        偏光状態
+    work : Workspace
+        作業バッファ(省略時はスレッドごとの既定のバッファ)
+    adaptive : bool
+        全波長で計算する入射角で波長帯を分割するか
+
+    Returns
+    -------
+    groups : tuple of tuple
+        求積点の数が等しい入射角ごとの(入射角の番号, 求積点の数, 各波長帯のサンプル数, 反射率)
+        求積点の数が0の組は各波長帯を分割したサンプルの分光反射率，
+        それ以外の組のサンプル数はNone(読み取り専用)
+
+    Notes
+    -----
+    求積点の数はquadrature_nodesで入射角ごとに決める
+    adaptiveの場合はrefinement_factorsで分割し，等色関数が無視できる波長帯は分割しない
+    求積点の波長は光源によらないため，結果から任意の光源の色を計算できる
+    """
+    cos_array = np.asarray(cos_array, dtype=float)
+    grid = stack.grid
+    nodes = quadrature_nodes(stack, cos_array)
+    eta = np.asarray(stack.eta, dtype=complex)
+    m_xyz = np.abs(grid.xyz_matrix())
+    coloured = np.max(m_xyz, axis=1) > ADAPTIVE_COLOUR_EPS * np.max(m_xyz)
+    groups = []
+    for n in np.unique(nodes):
+        rows = np.flatnonzero(nodes == n)
+        if n == 0 and adaptive:
+            # 最大のサンプル数が等しい入射角ごとに分割
+            factors = refinement_factors(stack, cos_array[rows])
+            factors[:, ~coloured] = 1
+            top = np.max(factors, axis=1)
+            for k in np.unique(top):
+                m = np.max(factors[top == k], axis=0)
+                v = evaluate_stack_samples(stack, cos_array[rows[top == k]], m, polarized, work)
+                groups.append((rows[top == k], 0, m, v))
+        elif n == 0:
+            v = evaluate_stack(stack, cos_array[rows], polarized, work).data
+            groups.append((rows, 0, np.ones(grid.n, dtype=int), v))
+        else:
+            wl, _ = grid.quadrature_basis(n)
+            eta_n = np.array([np.interp(wl, grid.wavelength, e) for e in eta])
+            v = stack_reflectance(stack, eta_n, wl, cos_array[rows], polarized, work)
+            groups.append((rows, int(n), None, v))
+    for rows, _, m, v in groups:
+        for array in (rows, m, v):
+            if array is not None:
+                array.setflags(write=False)
+    return tuple(groups)
+
+
+def pack_nodes(groups):
+    """
+    求積点の反射率を1つの配列にまとめる(ディスクキャッシュ用)
+
+    Parameters
+    ----------
+    groups : tuple of tuple
+        evaluate_stack_nodesの結果
+
+    Returns
+    -------
+    packed : ndarray
+        組の数，各組の(入射角数, 求積点の数, サンプル数の配列の長さ, 反射率の列数)，
+        各組の入射角の番号，サンプル数，反射率を順に並べた1次元配列
+    """
+    header = [len(groups)]
+    data = []
+    for rows, n, m, v in groups:
+        header += [len(rows), n, 0 if m is None else len(m), v.shape[1]]
+        data += [rows, () if m is None else m, v.ravel()]
+    return np.concatenate([np.array(header, dtype=float)]
+                          + [np.asarray(a, dtype=float) for a in data])
+
+
+def unpack_nodes(packed):
+    """
+    pack_nodesでまとめた配列から求積点の反射率を復元
+
+    Parameters
+    ----------
+    packed : ndarray
+        pack_nodesの結果
+
+    Returns
+    -------
+    groups : tuple of tuple
+        evaluate_stack_nodesと同じ形式の組(読み取り専用)
+    """
+    count = int(packed[0])
+    header = packed[1:1 + 4 * count].astype(int).reshape(count, 4)
+    pos = 1 + 4 * count
+    groups = []
+    for k, n, length, width in header:
+        rows = packed[pos:pos + k].astype(int)
+        pos += k
+        m = packed[pos:pos + length].astype(int) if length else None
+        pos += length
+        v = packed[pos:pos + k * width].reshape(k, width)
+        pos += k * width
+        for array in (rows, m, v):
+            if array is not None:
+                array.setflags(write=False)
+        groups.append((rows, int(n), m, v))
+    return tuple(groups)
+
+
+def nodes_to_colour(groups, grid=None, illuminant=None, rgb=True):
+    """
+    求積点の反射率から色を計算
+
+    Parameters
+    ----------
+    groups : tuple of tuple
+        evaluate_stack_nodesの結果
+    grid : SpectralGrid
+        波長サンプリング(省略時は既定の波長サンプリング)
+    illuminant : Illuminant
+        光源(省略時は等エネルギー白色光源)
+    rgb : bool
+        Trueの場合はRGB値，Falseの場合はXYZ三刺激値
+
+    Returns
+    -------
+    v : MaskedArray
+        色(形状は(入射角数, 3)，計算できない入射角はマスク)
+
+    Notes
+    -----
+    波長帯を分割したサンプルはrefined_colour_matrixで各サンプルの波長の等色関数で積分する
+    """
+    v = np.empty((sum(len(rows) for rows, _, _, _ in groups), 3))
+    for rows, n, m, r in groups:
+        if n == 0:
+            v[rows] = r @ refined_colour_matrix(as_grid(grid), m, illuminant, rgb)
+        else:
+            v[rows] = r @ quadrature_weights(n, grid, illuminant, rgb)[1]
+    return masked_reflectance(v)
+
+
+def evaluate_stack_colour(stack, cos_array, polarized=UNPOLARIZED, rgb=True,
+                          work=None, adaptive=False, illuminant=None):
+    """
+    多層膜の複数の入射角に対する反射光の色を計算
+
+    Parameters
+    ----------
+    stack : FilmStack
+        多層膜
+    cos_array : ndarray
+        入射角余弦の配列
+    polarized : int
+        偏光状態
+    rgb : bool
+        Trueの場合はRGB値，Falseの場合はXYZ三刺激値
+    work : Workspace
+        作業バッファ(省略時はスレッドごとの既定のバッファ)
+    adaptive : bool
+        全波長で計算する入射角で波長帯を分割するか
+    illuminant : Illuminant
+        光源(省略時は等エネルギー白色光源)
+
+    Returns
+    -------
+    v : MaskedArray
+        色(形状は(入射角数, 3)，読み取り専用)
+
+    Notes
+    -----
+    可視域の求積点(SpectralGrid.quadrature)でのみ反射率を計算し重み付き和で色を求める
+    求積点の数はquadrature_nodesで入射角ごとに決め，同じ点数の入射角をまとめて計算する
+    全波長で計算するより多くの点が必要な入射角は全波長の分光反射率から変換する
+    単層薄膜(膜厚0-1000nm，屈折率1.2-2.5，吸収のある基板を含む，入射角0-90度)で
+    測定したXYZ三刺激値の誤差は全波長の計算に対して3e-4以下
+    adaptiveの場合は波長帯を分割したサンプルごとの等色関数で積分する
+    単層薄膜(膜厚100nm-20μm，屈折率1.2-2.5，吸収のある基板を含む)で測定した
+    256倍に分割した波長サンプリングの計算に対するXYZ三刺激値の誤差は，
+    入射角0-80度で3e-4以下，0-89度で2.3e-3以下(サンプル数が上限となる20μmの斜入射)
+    """
+    groups = evaluate_stack_nodes(stack, cos_array, polarized, work, adaptive)
+    return nodes_to_colour(groups, stack.grid, illuminant, rgb)
+
+
+class InterfaceTerms:
+    """
+    膜厚に依存しない界面の係数を保持するクラス
+
+    Attributes
+    ----------
+    __r01 : ndarray
+        入射媒質から薄膜へ進む光の反射係数(p偏光とs偏光)
+    __r12 : ndarray
+        薄膜から出射媒質へ進む光の反射係数(p偏光とs偏光)
+    __k : ndarray
+        膜厚あたりの位相差
+
+    Notes
+    -----
+    単層薄膜を仮定
+    フレネル係数は屈折率と入射角のみに依存するため一度だけ計算し，
+    膜厚ごとには位相差と等比数列の和の再計算のみを行う
+    """
+
+    def __init__(self, films, cos_array, grid=None):
+        """
+        初期化
+
+        Parameters
+        ----------
+        films : list of ThinFilm, or FilmStack
+            薄膜層の配列(薄膜の膜厚は無視)
+        cos_array : ndarray
+            入射角余弦の配列
+        grid : SpectralGrid
+            波長サンプリング(省略時は先頭の層の屈折率の波長サンプリング)
+        """
+        stack = as_stack(films, grid)
+        eta = np.asarray(stack.eta, dtype=complex) # 各層の屈折率
+        cos0, cos1, cos2 = layer_cos(eta, cos_array)
+        n0, n1, n2 = eta
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.__r01 = np.array([fresnel_rp(cos0, cos1, n0, n1), fresnel_rs(cos0, cos1, n0, n1)])
+            self.__r12 = np.array([fresnel_rp(cos1, cos2, n1, n2), fresnel_rs(cos1, cos2, n1, n2)])
+        self.__k = 4.j * np.pi / stack.grid.wavelength * n1 * cos1
+
+    def evaluate(self, d_array, polarized=UNPOLARIZED, work=None):
+        """
+        複数の膜厚に対する薄膜干渉の分光反射率を一括計算
+
+        Parameters
+        ----------
+        d_array : ndarray
+            薄膜の膜厚の配列
+        polarized : int
+            偏光状態
+        work : Workspace
+            作業バッファ(省略時はスレッドごとの既定のバッファ)
+
+        Returns
+        -------
+        v : MaskedArray
+            分光反射率(形状は(膜厚数, 入射角数, 波長サンプル数))
+
+        Notes
+        -----
+        計算できない(値が有限でない)要素はマスクされる
+        """
+        if work is None:
+            work = get_workspace()
+        # 必要な偏光の係数のみ計算
+        if polarized == P_POLARIZED:
+            index = slice(0, 1)
+        elif polarized == S_POLARIZED:
+            index = slice(1, 2)
+        else:
+            index = slice(0, 2)
+        r01 = self.__r01[index]
+        r12 = self.__r12[index]
+        d = np.asarray(d_array, dtype=float).reshape(-1, 1, 1, 1)
+        shape = (len(d),) + r01.shape
+        e = work.get('phase', (len(d),) + self.__k.shape)
+        np.multiply(d[:, 0], self.__k, out=e)
+        np.exp(e, out=e) # 位相項
+        t = work.get('term', shape)
+        r = np.empty(shape, dtype=complex)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            np.multiply(r12, e[:, np.newaxis], out=t)
+            np.add(r01, t, out=r) # 分子
+            np.multiply(t, r01, out=t)
+            np.add(t, 1, out=t)   # 分母
+            np.divide(r, t, out=r)
+        v = polarized_reflectance(r[:, 0], r[:, -1], polarized)
+        return np.ma.masked_invalid(v)
+
+
 class Irid:
     """
     薄膜干渉計算クラス
     
     Attributes
     ----------
-    __films : list of Film
+    __films : list of ThinFilm or PeriodicStack, or FilmStack
         薄膜層の配列
+    __cache : LRUCache
+        計算結果のキャッシュ(Noneの場合は使用しない)
+    __grid : SpectralGrid
+        計算する波長サンプリング(Noneの場合は先頭の層の屈折率の波長サンプリング)
     """
     
-    def __init__(self, films):
+    def __init__(self, films, cache=EVAL_CACHE, grid=None):
         """
         初期化
 
         Parameters
         ----------
-        films : list of FIlm
+        films : list of ThinFilm or PeriodicStack, or FilmStack
             薄膜層の配列
+        cache : LRUCache
+            計算結果のキャッシュ(Noneの場合は使用しない)
+        grid : SpectralGrid
+            計算する波長サンプリング(省略時は先頭の層の屈折率の波長サンプリング)
         """
         self.__films = films
+        self.__cache = cache
+        self.__grid = grid
 
 
     @property
@@ -179,7 +1465,20 @@ class Irid:
     def films(self, f):
         self.__films = f
 
-    def evaluate(self, cos_in, polarized=UNPOLARIZED):
+    @property
+    def grid(self):
+        if self.__grid is not None:
+            return self.__grid
+        if isinstance(self.__films, FilmStack):
+            return self.__films.grid
+        layers, _ = flatten_films(list(self.__films))
+        return layers[0].eta.grid if layers else DEFAULT_GRID
+
+    @grid.setter
+    def grid(self, grid):
+        self.__grid = grid
+
+    def evaluate(self, cos_in, polarized=UNPOLARIZED, adaptive=False):
         """
         薄膜干渉の分光反射率を計算
 
@@ -189,6 +1488,8 @@ class Irid:
             入射角余弦
         polarized : int
             偏光状態
+        adaptive : bool
+            Trueの場合は干渉縞に応じて波長帯を分割して平均(厚い膜での折り返し雑音を防ぐ)
 
         Returns
         -------
@@ -197,66 +1498,129 @@ class Irid:
 
         Notes
         -----
-        単層薄膜を仮定
-        自作クラスのndarrayやcomplexが使えないため直接計算
+        計算できない場合は値が0のスペクトルを返す
+        全反射や吸収のある層も複素屈折率と複素屈折角余弦で扱う
         """
-        sin_in = np.sqrt(max(0, 1 - cos_in**2))
-        index = 0
-        cos_theta_array = np.zeros([len(self.films), NSAMPLESPECTRUM]) # 各層への入射角の余弦
-        eta_in = self.films[0].eta
-        # 各層への入射角余弦を計算
-        for film in self.films:
-            cos_theta = np.zeros([NSAMPLESPECTRUM])
-            for i in range(NSAMPLESPECTRUM):
-                # スネルの法則から屈折角余弦を計算
-                sin_theta = eta_in[i] * sin_in / film.eta[i]
-                if (sin_theta.real ** 2 > 1): # 全反射
-                    return Spectrum()
-                cos_theta[i] = np.sqrt(max(0, 1. - sin_theta**2)) # i番目の波長帯での入射角余弦
-            cos_theta_array[index] = cos_theta
-            index = index + 1
-        # 波長生成
-        step = (END_WAVELENGTH - START_WAVELENGTH) / NSAMPLESPECTRUM
-        v  = np.zeros(NSAMPLESPECTRUM)
-        wl = np.zeros(NSAMPLESPECTRUM)
-        for i in range(NSAMPLESPECTRUM):
-            wl[i] = START_WAVELENGTH + step/2 + i*step
-        # 反射率計算
-        rp = np.zeros(NSAMPLESPECTRUM) # p偏光の反射係数
-        rs = np.zeros(NSAMPLESPECTRUM) # s偏光の反射係数
-        for j in range(NSAMPLESPECTRUM):
-            cos0 = cos_theta_array[0][j]
-            cos1 = cos_theta_array[1][j]
-            cos2 = cos_theta_array[2][j]
-            n0 = self.films[0].eta[j]
-            n1 = self.films[1].eta[j]
-            n2 = self.films[2].eta[j]
-            # フレネル係数計算
-            rp01 = fresnel_rp(cos0, cos1, n0, n1)
-            rs01 = fresnel_rs(cos0, cos1, n0, n1)
-            rp10 = fresnel_rp(cos1, cos0, n1, n0)
-            rs10 = fresnel_rs(cos1, cos0, n1, n0)
-            rp12 = fresnel_rp(cos1, cos2, n1, n2)
-            rs12 = fresnel_rs(cos1, cos2, n1, n2)
-            tp01 = fresnel_tp(cos0, cos1, n0, n1)
-            ts01 = fresnel_ts(cos0, cos1, n0, n1)
-            tp10 = fresnel_tp(cos1, cos0, n1, n0)
-            ts10 = fresnel_ts(cos1, cos0, n1, n0)
-            phi = 4 * np.pi * self.films[1].d / wl[j] * n1 * cos1 # 位相差
-            rp[j] = irid_r(rp01, rp10, rp12, tp01, tp10, phi)
-            rs[j] = irid_r(rs01, rs10, rs12, ts01, ts10, phi)
-        # 偏光状態による場合分け
-        if polarized == UNPOLARIZED:
-            v = (np.abs(rp) ** 2 + np.abs(rs) ** 2) / 2
-        elif polarized == P_POLARIZED:
-            v = np.abs(rp) ** 2
-        elif polarized == S_POLARIZED:
-            v = np.abs(rs) ** 2
-        spd = Spectrum(wl, v)
+        v = self.evaluate_angles([cos_in], polarized, adaptive)[0]
+        if np.ma.is_masked(v): # 計算できない入射角
+            return Spectrum(grid=self.grid)
+        spd = Spectrum.from_array(v.data, grid=self.grid)
         return spd
 
 
-    def create_texture(self, width=270, height=90):
+    def evaluate_angles(self, cos_array, polarized=UNPOLARIZED, adaptive=False):
+        """
+        複数の入射角に対する薄膜干渉の分光反射率を一括計算
+
+        Parameters
+        ----------
+        cos_array : ndarray
+            入射角余弦の配列
+        polarized : int
+            偏光状態
+        adaptive : bool
+            Trueの場合は干渉縞に応じて波長帯を分割して平均(厚い膜での折り返し雑音を防ぐ)
+
+        Returns
+        -------
+        v : MaskedArray
+            分光反射率(形状は(入射角数, 波長サンプル数))
+
+        Notes
+        -----
+        evaluate_stack(adaptiveの場合はevaluate_stack_adaptive)の結果を読み取り専用でメモリとディスク(設定時)にキャッシュする
+        """
+        cos_array = np.asarray(cos_array, dtype=float)
+        stack = as_stack(self.films, self.__grid)
+        key = ('angles', stack.digest, array_digest(cos_array), polarized,
+               bool(adaptive)) + stack.grid.key
+        if self.__cache is not None:
+            v = self.__cache.get(key)
+            if v is not None:
+                return v
+        # ディスクキャッシュ
+        disk = get_disk_cache()
+        v = None if disk is None else disk.get(key)
+        if v is not None:
+            v = masked_reflectance(v)
+        else:
+            if adaptive:
+                v = evaluate_stack_adaptive(stack, cos_array, polarized)
+            else:
+                v = evaluate_stack(stack, cos_array, polarized)
+            if disk is not None:
+                disk.put(key, v.data)
+        if self.__cache is not None:
+            self.__cache.put(key, v)
+        return v
+
+
+    def evaluate_colour(self, cos_array, polarized=UNPOLARIZED, rgb=True, adaptive=False,
+                        illuminant=None):
+        """
+        複数の入射角に対する反射光の色を一括計算
+
+        Parameters
+        ----------
+        cos_array : ndarray
+            入射角余弦の配列
+        polarized : int
+            偏光状態
+        rgb : bool
+            Trueの場合はRGB値，Falseの場合はXYZ三刺激値
+        adaptive : bool
+            全波長で計算する入射角で波長帯を分割するか
+        illuminant : Illuminant
+            光源(省略時は等エネルギー白色光源)
+
+        Returns
+        -------
+        v : MaskedArray
+            色(形状は(入射角数, 3))
+
+        Notes
+        -----
+        可視域の求積点での反射率(evaluate_stack_nodes)を光源によらずメモリとディスク(設定時)にキャッシュし，
+        色は光源の重みを掛けて求めるため光源を切り替えても反射率は再計算しない
+        """
+        cos_array = np.asarray(cos_array, dtype=float)
+        stack = as_stack(self.films, self.__grid)
+        key = ('nodes', stack.digest, array_digest(cos_array), polarized,
+               bool(adaptive)) + stack.grid.key
+        groups = None if self.__cache is None else self.__cache.get(key)
+        if groups is None:
+            # ディスクキャッシュ
+            disk = get_disk_cache()
+            packed = None if disk is None else disk.get(key)
+            if packed is not None:
+                groups = unpack_nodes(packed)
+            else:
+                groups = evaluate_stack_nodes(stack, cos_array, polarized, adaptive=adaptive)
+                if disk is not None:
+                    disk.put(key, pack_nodes(groups))
+            if self.__cache is not None:
+                self.__cache.put(key, groups)
+        return nodes_to_colour(groups, stack.grid, illuminant, rgb)
+
+
+    def interface_terms(self, cos_array):
+        """
+        膜厚に依存しない界面の係数を計算
+
+        Parameters
+        ----------
+        cos_array : ndarray
+            入射角余弦の配列
+
+        Returns
+        -------
+        terms : InterfaceTerms
+            界面の係数
+        """
+        return InterfaceTerms(self.films, cos_array, self.__grid)
+
+
+    def create_texture(self, width=270, height=90, adaptive=False, illuminant=None):
         """
         入射角が0-90度の反射率テクスチャを作成
 
@@ -266,25 +1630,30 @@ class Irid:
             テクスチャ画像の幅
         height : int
             テクスチャ画像の高さ
+        adaptive : bool
+            Trueの場合は干渉縞に応じて波長帯を分割して平均
+        illuminant : Illuminant
+            光源(省略時は等エネルギー白色光源)
 
         Returns
         -------
         img : ndarray
             RGB値の反射率テクスチャ
-        
+
+        Notes
+        -----
+        色は可視域の求積点のみで計算する(evaluate_colour)
         """
-        img = np.zeros([height, width, 3])
         invstep = width / 90
-        for i in range (width):
-            temp = self.evaluate(np.cos(np.pi/180 * i/invstep))
-            temp = temp.to_rgb()
-            for j in range (height):
-                img[j][i] = temp
+        cos_array = np.cos(np.pi/180 * np.arange(width)/invstep)
+        rgb = self.evaluate_colour(cos_array, adaptive=adaptive,
+                                   illuminant=illuminant).filled(0.0)
+        img = np.broadcast_to(rgb, (height, width, 3))
         img = np.clip(img, 0.0, 1.0)
         return img
 
 
-    def create_csv(self, path):
+    def create_csv(self, path, illuminant=None):
         """
         入射角が0-90度の反射率をCSV出力
 
@@ -292,13 +1661,15 @@ class Irid:
         ----------
         path : string
             出力ファイル名
+        illuminant : Illuminant
+            光源(省略時は等エネルギー白色光源)
         """
 
-        data = np.zeros([90, NSAMPLESPECTRUM])
-        RGB = np.zeros([90, 3])
-        for i in range (90):
-            spd = self.evaluate(np.cos(np.pi/180 * i))
-            RGB[i] = spd.to_rgb()
-            #for j in range (NSAMPLESPECTRUM):
-            #    data[i][j] = spd.c[j]
-        np.savetxt(path ,np.clip(RGB,0.0,1.0),delimiter=',', fmt='%.4f')
\ No newline at end of file
+        cos_array = np.cos(np.pi/180 * np.arange(90))
+        RGB = self.evaluate_colour(cos_array, illuminant=illuminant).filled(0.0)
+        np.savetxt(path ,np.clip(RGB,0.0,1.0),delimiter=',', fmt='%.4f')
+
+
+# 環境変数が設定されていればディスクキャッシュを使用
+if os.environ.get(DISK_CACHE_ENV):
+    set_disk_cache(os.environ[DISK_CACHE_ENV])
@@ -0,0 +1,327 @@
+import threading
+import numpy as np
+from spectrum import *
+from utility import *
+
+
+# 定数
+PLANCK_C2 = 1.4388e7 # 放射の第2定数(nm・K)
+TEMPERATURE_A = 2856  # CIE標準光源Aの色温度(K)
+
+# CIE標準光源D65の分光分布(300-830nm，10nm間隔)
+D65_WAVELENGTH = np.arange(300, 831, 10)
+D65_VALUES = np.array([
+      0.0341,   3.2945,  20.2360,  37.0535,  39.9488,  44.9117,  46.6383,  52.0891,
+     49.9755,  54.6482,  82.7549,  91.4860,  93.4318,  86.6823, 104.8650, 117.0080,
+    117.8120, 114.8610, 115.9230, 108.8110, 109.3540, 107.8020, 104.7900, 107.6890,
+    104.4050, 104.0460, 100.0000,  96.3342,  95.7880,  88.6856,  90.0062,  89.5991,
+     87.6987,  83.2886,  83.6992,  80.0268,  80.2146,  82.2778,  78.2842,  69.7213,
+     71.6091,  74.3490,  61.6040,  69.8856,  75.0870,  63.5927,  46.4182,  66.8054,
+     63.3828,  64.3040,  59.4519,  51.9590,  57.4406,  60.3125])
+
+
+class Illuminant:
+    """
+    光源の基底クラス
+
+    Attributes
+    ----------
+    __name : string
+        光源名
+    __cache : dict
+        波長サンプリングごとの分光分布と変換行列
+    __lock : Lock
+        キャッシュ更新用のロック
+
+    Notes
+    -----
+    変換行列は等色関数，光源の分光分布，完全拡散反射面のYが1となる正規化をまとめたもので，
+    波長サンプリングごとに一度だけ計算して共有する
+    RGB値への変換は光源の白色点への色順応を行わない
+    """
+
+    def __init__(self, name):
+        """
+        初期化
+
+        Parameters
+        ----------
+        name : string
+            光源名
+        """
+        self.__name = name
+        self.__cache = {}
+        self.__lock = threading.Lock()
+
+    @property
+    def name(self):
+        return self.__name
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self.__name)
+
+    def power(self, wl):
+        """
+        分光分布を計算
+
+        Parameters
+        ----------
+        wl : ndarray
+            波長(nm)
+
+        Returns
+        -------
+        s : ndarray
+            相対分光分布
+        """
+        raise NotImplementedError()
+
+    def spectrum(self, grid=None):
+        """
+        分光分布のスペクトルを取得
+
+        Parameters
+        ----------
+        grid : SpectralGrid
+            波長サンプリング(省略時は既定の波長サンプリング)
+
+        Returns
+        -------
+        spd : Spectrum
+            分光分布(読み取り専用)
+        """
+        return self.__tables(as_grid(grid))[0]
+
+    def xyz_matrix(self, grid=None):
+        """
+        分光反射率からXYZ三刺激値への変換行列を取得
+
+        Parameters
+        ----------
+        grid : SpectralGrid
+            波長サンプリング(省略時は既定の波長サンプリング)
+
+        Returns
+        -------
+        m : ndarray
+            変換行列(形状は(波長サンプル数, 3)，読み取り専用)
+        """
+        return self.__tables(as_grid(grid))[1]
+
+    def rgb_matrix(self, grid=None):
+        """
+        分光反射率からRGB値への変換行列を取得
+
+        Parameters
+        ----------
+        grid : SpectralGrid
+            波長サンプリング(省略時は既定の波長サンプリング)
+
+        Returns
+        -------
+        m : ndarray
+            変換行列(形状は(波長サンプル数, 3)，読み取り専用)
+        """
+        return self.__tables(as_grid(grid))[2]
+
+    def quadrature(self, grid, n):
+        """
+        色計算用の求積点と重みを取得
+
+        Parameters
+        ----------
+        grid : SpectralGrid
+            波長サンプリング
+        n : int
+            求積点の数
+
+        Returns
+        -------
+        wl : ndarray
+            求積点の波長(読み取り専用)
+        w_xyz : ndarray
+            XYZ三刺激値の重み(形状は(n, 3)，読み取り専用)
+        w_rgb : ndarray
+            RGB値の重み(形状は(n, 3)，読み取り専用)
+        """
+        grid = as_grid(grid)
+        key = grid.key + ('quadrature', int(n))
+        with self.__lock:
+            tables = self.__cache.get(key)
+        if tables is None:
+            wl, basis = grid.quadrature_basis(n)
+            w_xyz = basis.T @ self.xyz_matrix(grid)
+            w_rgb = w_xyz @ XYZ_TO_RGB.T
+            for m in (w_xyz, w_rgb):
+                m.setflags(write=False)
+            tables = (wl, w_xyz, w_rgb)
+            with self.__lock:
+                self.__cache[key] = tables
+        return tables
+
+    def __tables(self, grid):
+        """波長サンプリングごとの分光分布と変換行列(初回のみ計算)"""
+        key = grid.key
+        with self.__lock:
+            tables = self.__cache.get(key)
+            if tables is None:
+                wl = grid.wavelength
+                spd = Spectrum(wl, np.asarray(self.power(wl), dtype=float),
+                               name=self.name, grid=grid)
+                spd.c.setflags(write=False) # 共有するため書き換えを禁止
+                cmf = grid.cmf()
+                m_xyz = cmf.T * (spd.c / np.dot(cmf[1], spd.c))[:, np.newaxis]
+                m_rgb = m_xyz @ XYZ_TO_RGB.T
+                for m in (m_xyz, m_rgb):
+                    m.setflags(write=False)
+                tables = (spd, m_xyz, m_rgb)
+                self.__cache[key] = tables
+        return tables
+
+
+class ConstantIlluminant(Illuminant):
+    """
+    分光分布が波長によらず一定の光源(等エネルギー白色光源)
+    """
+
+    def power(self, wl):
+        return np.ones(np.shape(wl))
+
+
+class BlackbodyIlluminant(Illuminant):
+    """
+    黒体放射の光源
+
+    Attributes
+    ----------
+    __temperature : float
+        色温度(K)
+
+    Notes
+    -----
+    Planckの式による分光分布を560nmで100となるように正規化
+    """
+
+    def __init__(self, name, temperature):
+        """
+        初期化
+
+        Parameters
+        ----------
+        name : string
+            光源名
+        temperature : float
+            色温度(K)
+        """
+        super().__init__(name)
+        self.__temperature = temperature
+
+    @property
+    def temperature(self):
+        return self.__temperature
+
+    def power(self, wl):
+        wl = np.asarray(wl, dtype=float)
+        planck = lambda x: x ** -5 / np.expm1(PLANCK_C2 / (x * self.__temperature))
+        return 100 * planck(wl) / planck(560.0)
+
+
+class TabulatedIlluminant(Illuminant):
+    """
+    分光分布の表で与えられる光源
+
+    Attributes
+    ----------
+    __wl : ndarray
+        波長
+    __v : ndarray
+        相対分光分布
+
+    Notes
+    -----
+    表の範囲外の波長では端の値を使用
+    """
+
+    def __init__(self, name, wl, v):
+        """
+        初期化
+
+        Parameters
+        ----------
+        name : string
+            光源名
+        wl : ndarray
+            波長
+        v : ndarray
+            相対分光分布
+        """
+        super().__init__(name)
+        wl = np.asarray(wl, dtype=float)
+        v = np.asarray(v, dtype=float)
+        index = np.argsort(wl)
+        self.__wl, self.__v = wl[index], v[index]
+
+    @classmethod
+    def from_csv(cls, name, path):
+        """
+        CSVファイルから光源を生成
+
+        Parameters
+        ----------
+        name : string
+            光源名
+        path : string
+            CSVファイルのパス(load_spdの形式で1列目が波長，2列目が値)
+
+        Returns
+        -------
+        illuminant : TabulatedIlluminant
+            光源
+        """
+        return cls(name, *load_spd(path))
+
+    def power(self, wl):
+        return np.interp(wl, self.__wl, self.__v)
+
+
+# 光源の登録
+ILLUMINANTS = {}
+
+
+def register_illuminant(illuminant):
+    """
+    光源を登録
+
+    Parameters
+    ----------
+    illuminant : Illuminant
+        登録する光源
+    """
+    ILLUMINANTS[illuminant.name] = illuminant
+
+
+def get_illuminant(name):
+    """
+    登録された光源を取得
+
+    Parameters
+    ----------
+    name : string
+        光源名(Noneの場合はNone)
+
+    Returns
+    -------
+    illuminant : Illuminant
+        光源
+    """
+    if name is None:
+        return None
+    try:
+        return ILLUMINANTS[name]
+    except KeyError:
+        raise KeyError('unknown illuminant: ' + name) from None
+
+
+register_illuminant(ConstantIlluminant('E'))
+register_illuminant(TabulatedIlluminant('D65', D65_WAVELENGTH, D65_VALUES))
+register_illuminant(BlackbodyIlluminant('A', TEMPERATURE_A))
@@ -0,0 +1,310 @@
+import threading
+import numpy as np
+from film import *
+from spectrum import *
+from utility import *
+
+
+class Material:
+    """
+    材質(屈折率の波長分散モデル)の基底クラス
+
+    Attributes
+    ----------
+    __name : string
+        材質名
+    __cache : dict
+        波長サンプリングごとの屈折率スペクトル
+    __lock : Lock
+        キャッシュ更新用のロック
+
+    Notes
+    -----
+    屈折率スペクトルは波長サンプリングごとに一度だけ計算し，
+    同じ材質を使う全ての薄膜層で共有する
+    """
+
+    def __init__(self, name):
+        """
+        初期化
+
+        Parameters
+        ----------
+        name : string
+            材質名
+        """
+        self.__name = name
+        self.__cache = {}
+        self.__lock = threading.Lock()
+
+    @property
+    def name(self):
+        return self.__name
+
+    def eta(self, wl):
+        """
+        屈折率を計算
+
+        Parameters
+        ----------
+        wl : ndarray
+            波長(nm)
+
+        Returns
+        -------
+        eta : ndarray
+            屈折率(吸収がある場合は複素数)
+        """
+        raise NotImplementedError()
+
+    def spectrum(self, grid=None):
+        """
+        屈折率スペクトルを取得
+
+        Parameters
+        ----------
+        grid : SpectralGrid
+            波長サンプリング(省略時は既定の波長サンプリング)
+
+        Returns
+        -------
+        spd : Spectrum
+            屈折率スペクトル(読み取り専用)
+        """
+        grid = as_grid(grid)
+        key = grid.key
+        with self.__lock:
+            spd = self.__cache.get(key)
+            if spd is None:
+                wl = grid.wavelength
+                spd = Spectrum(wl, self.eta(wl), name=self.name, grid=grid)
+                spd.c.setflags(write=False) # 共有するため書き換えを禁止
+                self.__cache[key] = spd
+        return spd
+
+    def film(self, d=0.0, grid=None):
+        """
+        この材質の薄膜層を生成
+
+        Parameters
+        ----------
+        d : float
+            膜厚
+        grid : SpectralGrid
+            波長サンプリング(省略時は既定の波長サンプリング)
+
+        Returns
+        -------
+        film : ThinFilm
+            薄膜層
+        """
+        return ThinFilm(d, self.spectrum(grid))
+
+
+class ConstantMaterial(Material):
+    """
+    屈折率が波長によらず一定の材質
+
+    Attributes
+    ----------
+    __n : complex
+        屈折率
+    """
+
+    def __init__(self, name, n):
+        """
+        初期化
+
+        Parameters
+        ----------
+        name : string
+            材質名
+        n : complex
+            屈折率
+        """
+        super().__init__(name)
+        self.__n = n
+
+    def eta(self, wl):
+        return np.full(np.shape(wl), self.__n)
+
+
+class CauchyMaterial(Material):
+    """
+    Cauchyの分散式で表される材質
+
+    Attributes
+    ----------
+    __a : tuple of float
+        屈折率の係数(A, B, C)
+    __b : tuple of float
+        消衰係数の係数(D, E, F)
+
+    Notes
+    -----
+    n = A + B/λ^2 + C/λ^4, k = D + E/λ^2 + F/λ^4 (λはμm単位)
+    """
+
+    def __init__(self, name, a, b=(0.0, 0.0, 0.0)):
+        """
+        初期化
+
+        Parameters
+        ----------
+        name : string
+            材質名
+        a : tuple of float
+            屈折率の係数(A, B, C)
+        b : tuple of float
+            消衰係数の係数(D, E, F)
+        """
+        super().__init__(name)
+        self.__a = tuple(a)
+        self.__b = tuple(b)
+
+    def eta(self, wl):
+        inv_wl2 = (np.asarray(wl, dtype=float) / 1000) ** -2
+        n = self.__a[0] + self.__a[1] * inv_wl2 + self.__a[2] * inv_wl2**2
+        if not any(self.__b):
+            return n
+        k = self.__b[0] + self.__b[1] * inv_wl2 + self.__b[2] * inv_wl2**2
+        return n + 1.j * k
+
+
+class SellmeierMaterial(Material):
+    """
+    Sellmeierの分散式で表される材質
+
+    Attributes
+    ----------
+    __b : ndarray
+        係数B_i
+    __c : ndarray
+        係数C_i(μm^2)
+
+    Notes
+    -----
+    n^2 = 1 + Σ B_i λ^2 / (λ^2 - C_i) (λはμm単位)
+    """
+
+    def __init__(self, name, b, c):
+        """
+        初期化
+
+        Parameters
+        ----------
+        name : string
+            材質名
+        b : list of float
+            係数B_i
+        c : list of float
+            係数C_i(μm^2)
+        """
+        super().__init__(name)
+        self.__b = np.asarray(b, dtype=float)
+        self.__c = np.asarray(c, dtype=float)
+
+    def eta(self, wl):
+        wl2 = (np.asarray(wl, dtype=float)[..., np.newaxis] / 1000) ** 2
+        n2 = 1 + np.sum(self.__b * wl2 / (wl2 - self.__c), axis=-1)
+        return np.sqrt(n2)
+
+
+class TabulatedMaterial(Material):
+    """
+    測定値の表で与えられる材質
+
+    Attributes
+    ----------
+    __wl_n : ndarray
+        屈折率の波長
+    __n : ndarray
+        屈折率
+    __wl_k : ndarray
+        消衰係数の波長
+    __k : ndarray
+        消衰係数
+
+    Notes
+    -----
+    表の範囲外の波長では端の値を使用
+    """
+
+    def __init__(self, name, path_n, path_k=None):
+        """
+        初期化
+
+        Parameters
+        ----------
+        name : string
+            材質名
+        path_n : string
+            屈折率のCSVファイルのパス
+        path_k : string
+            消衰係数のCSVファイルのパス(省略時は吸収なし)
+
+        Notes
+        -----
+        CSVファイルはload_spdの形式(1列目が波長で2列目が値)
+        """
+        super().__init__(name)
+        self.__wl_n, self.__n = self.__sort(*load_spd(path_n))
+        self.__wl_k, self.__k = (None, None)
+        if path_k is not None:
+            self.__wl_k, self.__k = self.__sort(*load_spd(path_k))
+
+    @staticmethod
+    def __sort(wl, v):
+        index = np.argsort(wl)
+        return wl[index], v[index]
+
+    def eta(self, wl):
+        n = np.interp(wl, self.__wl_n, self.__n)
+        if self.__k is None:
+            return n
+        return n + 1.j * np.interp(wl, self.__wl_k, self.__k)
+
+
+# 材質の登録
+MATERIALS = {}
+
+
+def register_material(material):
+    """
+    材質を登録
+
+    Parameters
+    ----------
+    material : Material
+        登録する材質
+    """
+    MATERIALS[material.name] = material
+
+
+def get_material(name):
+    """
+    登録された材質を取得
+
+    Parameters
+    ----------
+    name : string
+        材質名
+
+    Returns
+    -------
+    material : Material
+        材質
+    """
+    try:
+        return MATERIALS[name]
+    except KeyError:
+        raise KeyError('unknown material: ' + name) from None
+
+
+register_material(ConstantMaterial('air', 1.0))
+register_material(SellmeierMaterial('BK7', # SCHOTT N-BK7
+                                    [1.03961212, 0.231792344, 1.01046945],
+                                    [0.00600069867, 0.0200179144, 103.560653]))
+register_material(SellmeierMaterial('fused_silica', # [Malitson 1965]
+                                    [0.6961663, 0.4079426, 0.8974794],
+                                    [0.0684043**2, 0.1162414**2, 9.896161**2]))
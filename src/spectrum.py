@@ -1,18 +1,285 @@
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
 import numpy as np
 import os
-from PIL import Image, ImageTk
+import threading
 from cmf import *
 from utility import *
 
 
-# 定数
+# 定数(既定の波長サンプリング)
 START_WAVELENGTH = 200  # 開始波長
 END_WAVELENGTH   = 1000 # 終了波長
 NSAMPLESPECTRUM  = 80   # 波長サンプル数
 RANGE_WAVELENGTH = END_WAVELENGTH - START_WAVELENGTH # 波長範囲
 STEP_WAVELENGTH  = RANGE_WAVELENGTH / NSAMPLESPECTRUM # 波長サンプリング間隔
+QUADRATURE_TAIL  = 1e-3 # 色計算の求積で区間外とする等色関数の累積の割合(各端)
+
+
+class SpectralGrid:
+    """
+    等間隔の波長サンプリングを表現するクラス
+
+    Attributes
+    ----------
+    __start : float
+        開始波長
+    __end : float
+        終了波長
+    __n : int
+        波長サンプル数
+    __wavelength : ndarray
+        各波長帯の中心波長(読み取り専用)
+
+    Notes
+    -----
+    変更不可でハッシュ可能(開始波長，終了波長，サンプル数が等しければ等価)
+    等色関数と色変換行列はサンプリングごとに一度だけ計算して共有する
+    """
+
+    __slots__ = ('__start', '__end', '__n', '__wavelength')
+
+
+    def __init__(self, start=START_WAVELENGTH, end=END_WAVELENGTH, n=NSAMPLESPECTRUM):
+        """
+        コンストラクタ
+
+        Parameters
+        ----------
+        start : float
+            開始波長
+        end : float
+            終了波長
+        n : int
+            波長サンプル数
+        """
+        if not (end > start and n > 0):
+            raise ValueError('invalid spectral grid: ({}, {}, {})'.format(start, end, n))
+        self.__start = start
+        self.__end = end
+        self.__n = int(n)
+        step = (end - start) / self.__n
+        self.__wavelength = start + step * (np.arange(self.__n) + 0.5)
+        self.__wavelength.setflags(write=False)
+
+    @property
+    def start(self):
+        return self.__start
+
+    @property
+    def end(self):
+        return self.__end
+
+    @property
+    def n(self):
+        return self.__n
+
+    @property
+    def range(self):
+        return self.__end - self.__start
+
+    @property
+    def step(self):
+        return (self.__end - self.__start) / self.__n
+
+    @property
+    def wavelength(self):
+        return self.__wavelength
+
+    @property
+    def edges(self):
+        return np.linspace(self.__start, self.__end, self.__n + 1)
+
+    @property
+    def key(self):
+        return (self.__start, self.__end, self.__n)
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __eq__(self, other):
+        if not isinstance(other, SpectralGrid):
+            return NotImplemented
+        return self.key == other.key
+
+    def __repr__(self):
+        return 'SpectralGrid(start={}, end={}, n={})'.format(*self.key)
+
+
+    def cmf(self):
+        """
+        XYZ等色関数を取得
+
+        Returns
+        -------
+        xyz : ndarray
+            各波長帯の等色関数の値(形状は(3, サンプル数)，読み取り専用)
+        """
+        return self.__tables()[0]
+
+    def y_luminance(self):
+        """1nmサンプリングの輝度成分"""
+        return self.__tables()[1]
+
+    def xyz_matrix(self):
+        """
+        分光値からXYZ三刺激値への変換行列を取得
+
+        Returns
+        -------
+        m : ndarray
+            正規化を含む変換行列(形状は(サンプル数, 3)，読み取り専用)
+        """
+        return self.__tables()[2]
+
+    def rgb_matrix(self):
+        """
+        分光値からRGB値への変換行列を取得
+
+        Returns
+        -------
+        m : ndarray
+            正規化を含む変換行列(形状は(サンプル数, 3)，読み取り専用)
+        """
+        return self.__tables()[3]
+
+    def quadrature(self, n):
+        """
+        色計算用の求積点と重みを取得
+
+        Parameters
+        ----------
+        n : int
+            求積点の数(2以上)
+
+        Returns
+        -------
+        wl : ndarray
+            求積点の波長(読み取り専用)
+        w_xyz : ndarray
+            XYZ三刺激値の重み(形状は(n, 3)，読み取り専用)
+        w_rgb : ndarray
+            RGB値の重み(形状は(n, 3)，読み取り専用)
+
+        Notes
+        -----
+        等色関数の累積がQUADRATURE_TAIL以上となる可視域の区間にChebyshev-Lobatto点を置き，
+        区間外は端の値で延長したLagrange補間を波長サンプリングの変換行列で積分して重みとする
+        分光値が区間内でn-1次多項式の場合は全波長での変換と一致し，
+        滑らかな分光値では点数について指数的に収束する
+        区間外の打ち切りによる誤差は等色関数の区間外の割合(各端QUADRATURE_TAIL)以下
+        """
+        wl, basis = self.quadrature_basis(n)
+        key = self.key + ('quadrature', int(n))
+        tables = CMF_TABLES.get(key)
+        if tables is None:
+            with CMF_LOCK:
+                tables = CMF_TABLES.get(key)
+                if tables is None:
+                    w_xyz = basis.T @ self.xyz_matrix()
+                    w_rgb = w_xyz @ XYZ_TO_RGB.T
+                    for m in (w_xyz, w_rgb):
+                        m.setflags(write=False)
+                    tables = (wl, w_xyz, w_rgb)
+                    CMF_TABLES[key] = tables
+        return tables
+
+    def quadrature_basis(self, n):
+        """
+        色計算用の求積点と補間の基底関数を取得
+
+        Parameters
+        ----------
+        n : int
+            求積点の数(2以上)
+
+        Returns
+        -------
+        wl : ndarray
+            求積点の波長(読み取り専用)
+        basis : ndarray
+            各求積点の基底関数の中心波長での値(形状は(サンプル数, n)，読み取り専用)
+
+        Notes
+        -----
+        求積点は光源によらず，重みは変換行列と基底関数の積(basis.T @ 変換行列)
+        """
+        key = self.key + ('quadrature_basis', int(n))
+        tables = CMF_TABLES.get(key)
+        if tables is None:
+            with CMF_LOCK:
+                tables = CMF_TABLES.get(key)
+                if tables is None:
+                    tables = self.__quadrature_basis(int(n))
+                    CMF_TABLES[key] = tables
+        return tables
+
+    def __quadrature_basis(self, n):
+        """求積点と基底関数の計算"""
+        m_xyz = self.xyz_matrix()
+        cum = np.cumsum(np.abs(m_xyz), axis=0) / np.sum(np.abs(m_xyz), axis=0)
+        inside = np.any((cum > QUADRATURE_TAIL) & (cum < 1 - QUADRATURE_TAIL), axis=1)
+        lo, hi = self.__wavelength[inside][[0, -1]]
+        t = np.cos(np.pi * np.arange(n) / (n - 1))[::-1]
+        wl = lo + (hi - lo) * (t + 1) / 2
+        # 各求積点のLagrange基底関数を中心波長で評価
+        x = np.clip(self.__wavelength, lo, hi)[:, np.newaxis]
+        diff = wl[:, np.newaxis] - wl
+        np.fill_diagonal(diff, 1.0)
+        basis = np.ones((len(x), n))
+        for k in range(n):
+            term = (x - wl[k]) / diff[:, k]
+            term[:, k] = 1.0
+            basis *= term
+        for m in (wl, basis):
+            m.setflags(write=False)
+        return (wl, basis)
+
+    def __tables(self):
+        """サンプリングごとの等色関数と変換行列(初回のみ計算)"""
+        key = self.key
+        tables = CMF_TABLES.get(key)
+        if tables is None:
+            with CMF_LOCK:
+                tables = CMF_TABLES.get(key)
+                if tables is None:
+                    xyz = np.array([cmf_x_simple(self.__wavelength),
+                                    cmf_y_simple(self.__wavelength),
+                                    cmf_z_simple(self.__wavelength)])
+                    y_luminance = np.sum(xyz[1]) * self.range / self.__n
+                    m_xyz = xyz.T * (self.range / (self.__n * y_luminance))
+                    m_rgb = m_xyz @ XYZ_TO_RGB.T
+                    for m in (xyz, m_xyz, m_rgb):
+                        m.setflags(write=False)
+                    tables = (xyz, y_luminance, m_xyz, m_rgb)
+                    CMF_TABLES[key] = tables
+        return tables
+
+
+# 波長サンプリングごとの等色関数と変換行列および求積点
+CMF_TABLES = {}
+CMF_LOCK = threading.RLock() # 求積点の計算中に変換行列を生成するため再入可能
+
+# 既定の波長サンプリング
+DEFAULT_GRID = SpectralGrid(START_WAVELENGTH, END_WAVELENGTH, NSAMPLESPECTRUM)
+
+# 各波長帯の中心波長(既定の波長サンプリングの全てのスペクトルで共有，読み取り専用)
+WAVELENGTH = DEFAULT_GRID.wavelength
+
+
+def as_grid(grid):
+    """
+    波長サンプリングを取得
+
+    Parameters
+    ----------
+    grid : SpectralGrid
+        波長サンプリング(Noneの場合は既定の波長サンプリング)
+
+    Returns
+    -------
+    grid : SpectralGrid
+        波長サンプリング
+    """
+    return DEFAULT_GRID if grid is None else grid
 
 
 class Spectrum:
@@ -23,18 +290,22 @@ class Spectrum:
     ----------
     __c : ndarray
         波長に対応する値
-    __wl : ndarray
-        波長(等間隔サンプリング)
     __name : string
         プロット時の名前
+    __grid : SpectralGrid
+        波長サンプリング
 
     Note
     ----
     スペクトルは等間隔でサンプリングされた波長と対応する値で表現
+    波長は同じ波長サンプリングの全てのスペクトルで共有する読み取り専用の配列
+    異なる波長サンプリングのスペクトル同士は演算できない(resampleで変換する)
     """
 
+    __slots__ = ('__c', '__name', '__grid')
+
 
-    def __init__(self, wl=None, v=None, constv=None, name='test'):
+    def __init__(self, wl=None, v=None, constv=None, name='test', grid=None):
         """
         コンストラクタ
 
@@ -48,21 +319,45 @@ class Spectrum:
             スペクトルが一定の場合の値
         name : string
             プロット時の名前
+        grid : SpectralGrid
+            波長サンプリング(省略時は既定の波長サンプリング)
         """
-        self.__c = np.zeros(NSAMPLESPECTRUM)
-        self.__wl = np.zeros(NSAMPLESPECTRUM)
         self.__name = name
-        # 波長配列の計算
-        for i in range(NSAMPLESPECTRUM):
-            self.__wl[i] = (START_WAVELENGTH 
-                            + STEP_WAVELENGTH * i 
-                            + STEP_WAVELENGTH * 0.5)
+        self.__grid = as_grid(grid)
         # 波長と値のペアが与えられた場合
         if (wl is not None and v is not None):
             self.from_sample(wl, v) # サンプルからスペクトルを生成
         # 定数がえられた場合
         elif (constv is not None):
-            self.__c = np.full(NSAMPLESPECTRUM, constv)
+            self.__c = np.full(self.__grid.n, constv)
+        else:
+            self.__c = np.zeros(self.__grid.n)
+
+
+    @classmethod
+    def from_array(cls, c, name='test', grid=None):
+        """
+        サンプリング済みの値の配列からスペクトルを生成
+
+        Parameters
+        ----------
+        c : ndarray
+            各波長帯の値(長さは波長サンプル数)
+        name : string
+            プロット時の名前
+        grid : SpectralGrid
+            波長サンプリング(省略時は既定の波長サンプリング)
+
+        Returns
+        -------
+        spd : Spectrum
+            配列を複製せずに保持するスペクトル
+        """
+        spd = cls.__new__(cls)
+        spd.__c = np.asarray(c)
+        spd.__name = name
+        spd.__grid = as_grid(grid)
+        return spd
 
 
     @property
@@ -71,7 +366,11 @@ class Spectrum:
 
     @property
     def wl(self):
-        return self.__wl
+        return self.__grid.wavelength
+
+    @property
+    def grid(self):
+        return self.__grid
 
     @property
     def name(self):
@@ -84,35 +383,86 @@ class Spectrum:
 
     def __add__(self, other):
         if type(other) == Spectrum:
-            return Spectrum(self.wl, self.c + other.c)
+            return self.__new(self.c + self.__other(other))
         else:
             raise TypeError()
 
     def __sub__(self, other):
         if type(other) == Spectrum:
-            return Spectrum(self.wl, self.c - other.c)
+            return self.__new(self.c - self.__other(other))
         else:
             raise TypeError()
 
     def __mul__(self, other):
         if type(other) == Spectrum:
-            return Spectrum(self.wl, self.c * other.c)
+            return self.__new(self.c * self.__other(other))
         else:
-            return Spectrum(self.wl, self.c * other)
+            return self.__new(self.c * other)
 
     def __rmul__(self, other):
         if type(other) == Spectrum:
-            return Spectrum(self.wl, self.c * other.c)
+            return self.__new(self.c * self.__other(other))
         else:
-            return Spectrum(self.wl, self.c * other)
+            return self.__new(self.c * other)
 
     def __truediv__(self, other):
         if type(other) == Spectrum:
             if (not other.is_zero_div()):
                 raise ZeroDivisionError()
-            return Spectrum(self.wl, self.c / other.c)
+            return self.__new(self.c / self.__other(other))
+        else:
+            return self.__new(self.c / other)
+
+    def __iadd__(self, other):
+        if type(other) == Spectrum:
+            return self.__inplace(np.add, self.__other(other))
         else:
-            return Spectrum(self.wl, self.c / other)
+            raise TypeError()
+
+    def __isub__(self, other):
+        if type(other) == Spectrum:
+            return self.__inplace(np.subtract, self.__other(other))
+        else:
+            raise TypeError()
+
+    def __imul__(self, other):
+        if type(other) == Spectrum:
+            return self.__inplace(np.multiply, self.__other(other))
+        else:
+            return self.__inplace(np.multiply, other)
+
+    def __itruediv__(self, other):
+        if type(other) == Spectrum:
+            if (not other.is_zero_div()):
+                raise ZeroDivisionError()
+            return self.__inplace(np.divide, self.__other(other))
+        else:
+            return self.__inplace(np.divide, other)
+
+    def __new(self, c):
+        """同じ波長サンプリングのスペクトルを生成"""
+        return Spectrum.from_array(c, grid=self.__grid)
+
+    def __other(self, other):
+        """波長サンプリングが一致することを確認して値の配列を取得"""
+        if other.grid is not self.__grid and other.grid != self.__grid:
+            raise ValueError('spectral grids differ: {} and {}'.format(self.__grid, other.grid))
+        return other.c
+
+    def __inplace(self, op, v):
+        """
+        値の配列を直接更新する演算
+
+        Notes
+        -----
+        型が変わる場合や配列が読み取り専用(共有)の場合は新しい配列に置き換える
+        """
+        if (self.__c.flags.writeable
+                and np.result_type(self.__c, v) == self.__c.dtype):
+            op(self.__c, v, out=self.__c)
+        else:
+            self.__c = op(self.__c, v)
+        return self
 
     def __getitem__(self, key):
         return self.c[key]
@@ -129,47 +479,71 @@ class Spectrum:
             波長
         v : ndarray
             波長に対応する値
+
+        Notes
+        -----
+        波長が波長サンプリングの中心波長と一致する場合は補間せずに値を複製
+        それ以外はサンプルを線形補間した関数の各波長帯での平均値(bin_averageを参照)
+        """
+        wl = np.asarray(wl)
+        v = np.asarray(v)
+        center = self.__grid.wavelength
+        if wl.shape == center.shape and np.array_equal(wl, center):
+            self.__c = np.array(v)
+            return
+        self.__c = bin_average(wl, v, self.__grid)
+
+
+    def resample(self, grid):
+        """
+        別の波長サンプリングのスペクトルに変換
+
+        Parameters
+        ----------
+        grid : SpectralGrid
+            波長サンプリング
+
+        Returns
+        -------
+        spd : Spectrum
+            各波長帯で平均したスペクトル(同じ波長サンプリングの場合は自身)
         """
-        samples = {key: val for key, val in zip(wl, v)}
-        samples = sorted(samples.items())
-        samples = np.array(samples)
-        samples = np.transpose(samples)
-        wl, v = samples[0], samples[1]
-        # サンプルの補間
-        for i in range(NSAMPLESPECTRUM):
-            lambda0 = lerp(i/NSAMPLESPECTRUM, START_WAVELENGTH, END_WAVELENGTH)
-            lambda1 = lerp((i+1)/NSAMPLESPECTRUM, START_WAVELENGTH, END_WAVELENGTH)
-            self.__c[i] = np.interp((lambda0+lambda1)*0.5, wl, v)
+        grid = as_grid(grid)
+        if grid == self.__grid:
+            return self
+        return Spectrum(self.wl, self.c, name=self.__name, grid=grid)
 
 
-    def to_xyz(self):
+    def to_xyz(self, illuminant=None):
         """
         SPDをXYZ三刺激値に変換
 
+        Parameters
+        ----------
+        illuminant : Illuminant
+            光源(省略時は等エネルギー白色光源)
+
         Returns
         -------
         xyz : 変換後のXYZ三刺激値
         """
-        xyz = np.empty(3)
-        xyz[0] = np.sum(X.c * self.c)
-        xyz[1] = np.sum(Y.c * self.c)
-        xyz[2] = np.sum(Z.c * self.c)
-        scale = (END_WAVELENGTH -START_WAVELENGTH) / (NSAMPLESPECTRUM * Y_luminance)
-        xyz *= scale
-        return xyz
+        return self.c @ colour_matrix(self.__grid, illuminant)
     
     
-    def to_rgb(self):
+    def to_rgb(self, illuminant=None):
         """
         SPDをRGB値に変換
 
+        Parameters
+        ----------
+        illuminant : Illuminant
+            光源(省略時は等エネルギー白色光源)
+
         Returns
         -------
         rgb : 変換後のRGB値
         """
-        xyz = self.to_xyz()
-        rgb = xyz_to_rgb(xyz)
-        return rgb
+        return self.c @ colour_matrix(self.__grid, illuminant, rgb=True)
 
     def is_black(self):
         """ゼロ判定"""
@@ -181,31 +555,424 @@ class Spectrum:
         return np.count_nonzero(self.c)
 
 
-def create_cmf():
+class SpectrumArray:
+    """
+    複数のスペクトルを連続した配列で表現するクラス
+
+    Attributes
+    ----------
+    __c : ndarray
+        各スペクトルの値(形状は(スペクトル数, 波長サンプル数))
+    __grid : SpectralGrid
+        波長サンプリング
+
+    Note
+    ----
+    スライスは値を複製しないビューを返す
+    色変換は(スペクトル数, 波長サンプル数)と(波長サンプル数, 3)の行列積1回で行う
+    """
+
+    __slots__ = ('__c', '__grid')
+
+
+    def __init__(self, c, grid=None):
+        """
+        コンストラクタ
+
+        Parameters
+        ----------
+        c : ndarray
+            各スペクトルの値(形状は(スペクトル数, 波長サンプル数)，複製しない)
+        grid : SpectralGrid
+            波長サンプリング(省略時は既定の波長サンプリング)
+        """
+        grid = as_grid(grid)
+        c = np.asarray(c)
+        if c.ndim != 2 or c.shape[1] != grid.n:
+            raise ValueError('shape must be (n, {})'.format(grid.n))
+        self.__c = c
+        self.__grid = grid
+
+
+    @classmethod
+    def from_spectra(cls, spectra):
+        """
+        Spectrumの配列から生成
+
+        Parameters
+        ----------
+        spectra : list of Spectrum
+            スペクトルの配列(全て同じ波長サンプリング)
+
+        Returns
+        -------
+        spds : SpectrumArray
+            値を連続した配列に複製したスペクトル配列
+        """
+        spectra = list(spectra)
+        grid = spectra[0].grid if spectra else DEFAULT_GRID
+        if any(spd.grid != grid for spd in spectra):
+            raise ValueError('spectral grids differ')
+        return cls(np.array([spd.c for spd in spectra]).reshape(-1, grid.n), grid)
+
+
+    @classmethod
+    def from_samples(cls, wl, v, grid=None):
+        """
+        共通の波長のサンプルから生成
+
+        Parameters
+        ----------
+        wl : ndarray
+            波長(形状は(サンプル数,))
+        v : ndarray
+            各スペクトルの値(形状は(スペクトル数, サンプル数))
+        grid : SpectralGrid
+            波長サンプリング(省略時は既定の波長サンプリング)
+
+        Returns
+        -------
+        spds : SpectrumArray
+            各波長帯で平均したスペクトル配列
+        """
+        grid = as_grid(grid)
+        v = np.asarray(v)
+        return cls(bin_average(wl, v.reshape(-1, v.shape[-1]), grid), grid)
+
+
+    def to_spectra(self):
+        """
+        Spectrumの配列に変換
+
+        Returns
+        -------
+        spectra : list of Spectrum
+            各行のビューを保持するスペクトルの配列
+        """
+        return [Spectrum.from_array(c, grid=self.__grid) for c in self.__c]
+
+
+    @property
+    def c(self):
+        return self.__c
+
+    @property
+    def wl(self):
+        return self.__grid.wavelength
+
+    @property
+    def grid(self):
+        return self.__grid
+
+    @property
+    def shape(self):
+        return self.__c.shape
+
+
+    def __len__(self):
+        return self.__c.shape[0]
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return Spectrum.from_array(self.__c[key], grid=self.__grid)
+        return SpectrumArray(self.__c[key], self.__grid)
+
+    def __add__(self, other):
+        return SpectrumArray(self.__c + self.__operand(other), self.__grid)
+
+    def __sub__(self, other):
+        return SpectrumArray(self.__c - self.__operand(other), self.__grid)
+
+    def __mul__(self, other):
+        return SpectrumArray(self.__c * self.__operand(other), self.__grid)
+
+    def __rmul__(self, other):
+        return SpectrumArray(self.__operand(other) * self.__c, self.__grid)
+
+    def __truediv__(self, other):
+        return SpectrumArray(self.__c / self.__operand(other), self.__grid)
+
+    def __iadd__(self, other):
+        return self.__inplace(np.add, self.__operand(other))
+
+    def __isub__(self, other):
+        return self.__inplace(np.subtract, self.__operand(other))
+
+    def __imul__(self, other):
+        return self.__inplace(np.multiply, self.__operand(other))
+
+    def __itruediv__(self, other):
+        return self.__inplace(np.divide, self.__operand(other))
+
+    def __operand(self, other):
+        """
+        演算の相手を配列に変換
+
+        Notes
+        -----
+        Spectrumは全ての行に，長さがスペクトル数の配列は各行に作用する
+        """
+        if type(other) in (SpectrumArray, Spectrum):
+            if other.grid != self.__grid:
+                raise ValueError('spectral grids differ: {} and {}'.format(self.__grid, other.grid))
+            return other.c
+        other = np.asarray(other)
+        if other.ndim == 1:
+            return other[:, np.newaxis]
+        return other
+
+    def __inplace(self, op, v):
+        """値の配列を直接更新する演算(型が変わる場合や読み取り専用の場合は置き換え)"""
+        if (self.__c.flags.writeable
+                and np.result_type(self.__c, v) == self.__c.dtype):
+            op(self.__c, v, out=self.__c)
+        else:
+            self.__c = op(self.__c, v)
+        return self
+
+
+    def to_xyz(self, illuminant=None):
+        """
+        各スペクトルをXYZ三刺激値に変換
+
+        Parameters
+        ----------
+        illuminant : Illuminant
+            光源(省略時は等エネルギー白色光源)
+
+        Returns
+        -------
+        xyz : ndarray
+            XYZ三刺激値(形状は(スペクトル数, 3))
+        """
+        return self.__c @ colour_matrix(self.__grid, illuminant)
+
+
+    def to_rgb(self, illuminant=None):
+        """
+        各スペクトルをRGB値に変換
+
+        Parameters
+        ----------
+        illuminant : Illuminant
+            光源(省略時は等エネルギー白色光源)
+
+        Returns
+        -------
+        rgb : ndarray
+            RGB値(形状は(スペクトル数, 3))
+        """
+        return self.__c @ colour_matrix(self.__grid, illuminant, rgb=True)
+
+
+def colour_matrix(grid=None, illuminant=None, rgb=False):
+    """
+    分光反射率から色への変換行列を取得する関数
+
+    Parameters
+    ----------
+    grid : SpectralGrid
+        波長サンプリング(省略時は既定の波長サンプリング)
+    illuminant : Illuminant
+        光源(省略時は等エネルギー白色光源)
+    rgb : bool
+        Trueの場合はRGB値，Falseの場合はXYZ三刺激値への変換行列
+
+    Returns
+    -------
+    m : ndarray
+        等色関数，光源，正規化をまとめた変換行列(形状は(波長サンプル数, 3)，読み取り専用)
+    """
+    grid = as_grid(grid)
+    if illuminant is None:
+        return grid.rgb_matrix() if rgb else grid.xyz_matrix()
+    return illuminant.rgb_matrix(grid) if rgb else illuminant.xyz_matrix(grid)
+
+
+def quadrature_weights(n, grid=None, illuminant=None, rgb=False):
+    """
+    色計算用の求積点と重みを取得する関数
+
+    Parameters
+    ----------
+    n : int
+        求積点の数
+    grid : SpectralGrid
+        波長サンプリング(省略時は既定の波長サンプリング)
+    illuminant : Illuminant
+        光源(省略時は等エネルギー白色光源)
+    rgb : bool
+        TrueはRGB値，FalseはXYZ三刺激値の重み
+
+    Returns
+    -------
+    wl : ndarray
+        求積点の波長
+    w : ndarray
+        重み(形状は(n, 3)，読み取り専用)
+    """
+    grid = as_grid(grid)
+    if illuminant is None:
+        wl, w_xyz, w_rgb = grid.quadrature(n)
+    else:
+        wl, w_xyz, w_rgb = illuminant.quadrature(grid, n)
+    return wl, (w_rgb if rgb else w_xyz)
+
+
+def spectra_to_xyz(v, grid=None, illuminant=None):
+    """
+    波長サンプルの配列を一括でXYZ三刺激値に変換する関数
+
+    Parameters
+    ----------
+    v : ndarray
+        波長に対応する値(形状は(..., 波長サンプル数))
+    grid : SpectralGrid
+        波長サンプリング(省略時は既定の波長サンプリング)
+    illuminant : Illuminant
+        光源(省略時は等エネルギー白色光源)
+
+    Returns
+    -------
+    xyz : ndarray
+        XYZ三刺激値(形状は(..., 3))
+    """
+    return np.asarray(v) @ colour_matrix(grid, illuminant)
+
+
+def spectra_to_rgb(v, grid=None, illuminant=None):
+    """
+    波長サンプルの配列を一括でRGB値に変換する関数
+
+    Parameters
+    ----------
+    v : ndarray
+        波長に対応する値(形状は(..., 波長サンプル数))
+    grid : SpectralGrid
+        波長サンプリング(省略時は既定の波長サンプリング)
+    illuminant : Illuminant
+        光源(省略時は等エネルギー白色光源)
+
+    Returns
+    -------
+    rgb : ndarray
+        RGB値(形状は(..., 3))
+    """
+    return np.asarray(v) @ colour_matrix(grid, illuminant, rgb=True)
+
+
+def bin_average(wl, v, grid=None):
+    """
+    サンプルを線形補間した関数の各波長帯での平均値を一括で計算する関数
+
+    Parameters
+    ----------
+    wl : ndarray
+        波長(形状は(サンプル数,)，昇順でなくてもよい)
+    v : ndarray
+        波長に対応する値(形状は(..., サンプル数)，複素数も可)
+    grid : SpectralGrid
+        波長サンプリング(省略時は既定の波長サンプリング)
+
+    Returns
+    -------
+    c : ndarray
+        各波長帯の平均値(形状は(..., 波長サンプル数))
+
+    Notes
+    -----
+    台形則の累積和を各波長帯の境界でsearchsortedにより補間して積分する
+    サンプルより細かい波長帯では線形補間と一致し，粗い波長帯ではエイリアシングしない
+    サンプルの範囲外は端の値が続くとみなす(np.interpと同じ)
+    同じ波長のサンプルは後のものを使用
+    """
+    grid = as_grid(grid)
+    wl = np.asarray(wl).real.astype(float)
+    v = np.asarray(v)
+    # 波長順に並べ替えて重複を除く
+    order = np.argsort(wl, kind='stable')
+    wl, v = wl[order], v[..., order]
+    last = np.append(wl[1:] != wl[:-1], True)
+    wl, v = wl[last], v[..., last]
+    if len(wl) == 1:
+        return np.repeat(v, grid.n, axis=-1)
+    # サンプル点までの積分
+    dw = np.diff(wl)
+    cum = np.zeros(v.shape, dtype=np.result_type(v, float))
+    np.cumsum(0.5 * (v[..., 1:] + v[..., :-1]) * dw, axis=-1, out=cum[..., 1:])
+    # 波長帯の境界までの積分(区間内は台形，範囲外は端の値の長方形)
+    edges = grid.edges
+    x = np.clip(edges, wl[0], wl[-1])
+    k = np.clip(np.searchsorted(wl, x, side='right') - 1, 0, len(wl) - 2)
+    t = x - wl[k]
+    slope = (v[..., k + 1] - v[..., k]) / dw[k]
+    integral = cum[..., k] + (v[..., k] + 0.5 * slope * t) * t
+    integral += v[..., :1] * np.minimum(edges - wl[0], 0) + v[..., -1:] * np.maximum(edges - wl[-1], 0)
+    return np.diff(integral, axis=-1) / grid.step
+
+
+def create_wavelength(grid=None):
+    """
+    各波長帯の中心波長の配列を取得する関数
+
+    Parameters
+    ----------
+    grid : SpectralGrid
+        波長サンプリング(省略時は既定の波長サンプリング)
+
+    Returns
+    -------
+    wl : 波長配列(共有の読み取り専用配列)
+    """
+    return as_grid(grid).wavelength
+
+
+def create_cmf(grid=None):
     """
     XYZ等色関数の波長と値のペアを生成する関数
 
+    Parameters
+    ----------
+    grid : SpectralGrid
+        波長サンプリング(省略時は既定の波長サンプリング)
+
     Returns
     -------
     wl  : 波長配列
-    xyz : xyz等色関数の配列
+    xyz : xyz等色関数の配列(波長サンプリングごとに共有する読み取り専用配列)
     """
-    wl = np.zeros(NSAMPLESPECTRUM)
-    xyz = np.zeros([3, NSAMPLESPECTRUM])
-    for i in range(NSAMPLESPECTRUM):
-        wl[i] = START_WAVELENGTH  + STEP_WAVELENGTH * i + STEP_WAVELENGTH * 0.5
-        xyz[0][i] = cmf_x_simple(wl[i])
-        xyz[1][i] = cmf_y_simple(wl[i])
-        xyz[2][i] = cmf_z_simple(wl[i])
-    return wl, xyz
+    grid = as_grid(grid)
+    return grid.wavelength, grid.cmf()
 
 
-# XYZ等色関数の生成
+# 既定の波長サンプリングの等色関数と変換行列(初回参照時に生成)
 #path_xyz = os.path.join('data', 'cmf', 'ciexyz31.csv')
-#wl, xyz = load_cmf(path_xyz)
-wl, xyz = create_cmf()
-X = Spectrum(wl, xyz[0], name='X')
-Y = Spectrum(wl, xyz[1], name='Y')
-Z = Spectrum(wl, xyz[2], name='Z')
-# 1nmサンプリングの輝度成分
-Y_luminance = np.sum(Y.c) * (END_WAVELENGTH-START_WAVELENGTH) / NSAMPLESPECTRUM
\ No newline at end of file
+#wl, xyz = load_cmf(path_xyz, sidecar=True)
+LAZY_ATTRIBUTES = {
+    'X': lambda: Spectrum.from_array(DEFAULT_GRID.cmf()[0], name='X'),
+    'Y': lambda: Spectrum.from_array(DEFAULT_GRID.cmf()[1], name='Y'),
+    'Z': lambda: Spectrum.from_array(DEFAULT_GRID.cmf()[2], name='Z'),
+    # 1nmサンプリングの輝度成分
+    'Y_luminance': DEFAULT_GRID.y_luminance,
+    # 分光値からXYZ三刺激値とRGB値への変換行列(正規化を含む，形状は(NSAMPLESPECTRUM, 3))
+    'XYZ_MATRIX': DEFAULT_GRID.xyz_matrix,
+    'RGB_MATRIX': DEFAULT_GRID.rgb_matrix,
+}
+
+
+def __getattr__(name):
+    """
+    モジュール属性の遅延生成
+
+    Notes
+    -----
+    LAZY_ATTRIBUTESの属性は初回参照時に生成してモジュールに保持する
+    import時に等色関数を計算しないため，物理計算のみの利用では起動が速い
+    """
+    try:
+        factory = LAZY_ATTRIBUTES[name]
+    except KeyError:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name)) from None
+    value = factory()
+    globals()[name] = value
+    return value
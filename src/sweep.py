@@ -0,0 +1,741 @@
+import itertools
+import json
+import os
+import threading
+import numpy as np
+from film import *
+from spectrum import *
+
+
+# 定数
+SWEEP_MAX_BYTES  = 64 * 1024 ** 2 # 1チャンクあたりの作業メモリの上限(バイト)
+SWEEP_WORK_ARRAYS = 24             # 1要素あたりに確保される中間配列数の目安(complex128換算)
+SWEEP_PARALLEL_MAX_BYTES = 16 * 1024 ** 2 # 並列計算での1チャンクあたりの作業メモリの上限(負荷分散のため小さめ)
+SWEEP_POLL_INTERVAL = 0.1          # 並列計算の中止を確認する間隔(秒)
+SWEEP_INFLIGHT_PER_WORKER = 2      # 並列計算でワーカー1つあたりに投入しておくチャンク数
+SWEEP_FILE_VERSION  = 2            # 逐次出力ファイルの形式のバージョン
+SWEEP_FORMATS = ('npy', 'csv')     # 逐次出力の形式
+
+_sweep_worker = {} # ワーカープロセスの共有メモリと計算条件
+
+
+def plan_chunks(shape, bytes_per_element, max_bytes=SWEEP_MAX_BYTES):
+    """
+    作業メモリが上限に収まるようにチャンクの大きさを決定
+
+    Parameters
+    ----------
+    shape : tuple of int
+        分割する軸の大きさ
+    bytes_per_element : int
+        分割する軸の1要素あたりのバイト数
+    max_bytes : int
+        1チャンクあたりの作業メモリの上限
+
+    Returns
+    -------
+    chunk : tuple of int
+        各軸のチャンクの大きさ
+
+    Notes
+    -----
+    上限を超える間は最も大きい軸のチャンクを半分にする
+    全ての軸が1になった場合は上限を超えても1要素ずつ計算する
+    """
+    chunk = list(shape)
+    while np.prod(chunk) * bytes_per_element > max_bytes and max(chunk) > 1:
+        axis = int(np.argmax(chunk))
+        chunk[axis] = (chunk[axis] + 1) // 2
+    return tuple(chunk)
+
+
+def sweep_chunks(d, n1, n2, cos_in, polarized=(UNPOLARIZED,), n0=1.0,
+                 rgb=False, max_bytes=SWEEP_MAX_BYTES, grid=None, first=0):
+    """
+    パラメータ空間をチャンクに分割して反射率を計算するジェネレータ
+
+    Parameters
+    ----------
+    d : ndarray
+        薄膜の膜厚の軸
+    n1 : ndarray
+        薄膜の屈折率の軸(複素数可)
+    n2 : ndarray
+        ベース層の屈折率の軸(複素数可)
+    cos_in : ndarray
+        入射角余弦の軸
+    polarized : list of int
+        偏光状態の軸
+    n0 : float
+        入射媒質の屈折率
+    rgb : bool
+        Trueの場合は波長軸をRGB値に変換
+    max_bytes : int
+        1チャンクあたりの作業メモリの上限
+    grid : SpectralGrid
+        波長サンプリング(省略時は既定の波長サンプリング)
+    first : int
+        計算を開始するチャンクの番号(中断した計算の再開用)
+
+    Yields
+    ------
+    index : tuple of slice
+        出力テンソルにおけるチャンクの位置
+    v : ndarray
+        チャンクの反射率(形状は(d, n1, n2, cos_in, polarized, 波長またはRGB))
+    """
+    axes = sweep_axes(d, n1, n2, cos_in)
+    polarized = list(np.atleast_1d(polarized))
+    grid = as_grid(grid)
+    for index in chunk_layout(tuple(len(a) for a in axes), grid, max_bytes)[first:]:
+        yield index, evaluate_chunk(axes, index, polarized, n0, rgb, grid)
+
+
+def sweep_axes(d, n1, n2, cos_in):
+    """
+    パラメータの軸を1次元配列に変換
+
+    Parameters
+    ----------
+    d : ndarray
+        薄膜の膜厚の軸
+    n1 : ndarray
+        薄膜の屈折率の軸(複素数可)
+    n2 : ndarray
+        ベース層の屈折率の軸(複素数可)
+    cos_in : ndarray
+        入射角余弦の軸
+
+    Returns
+    -------
+    axes : list of ndarray
+        (d, n1, n2, cos_in)の各軸
+    """
+    return [np.atleast_1d(np.asarray(a, dtype=t))
+            for a, t in zip((d, n1, n2, cos_in), (float, complex, complex, float))]
+
+
+def chunk_layout(shape, grid=None, max_bytes=SWEEP_MAX_BYTES):
+    """
+    パラメータ空間のチャンク分割
+
+    Parameters
+    ----------
+    shape : tuple of int
+        (d, n1, n2, cos_in)の軸の大きさ
+    grid : SpectralGrid
+        波長サンプリング(省略時は既定の波長サンプリング)
+    max_bytes : int
+        1チャンクあたりの作業メモリの上限
+
+    Returns
+    -------
+    layout : list of tuple of slice
+        出力テンソルにおける各チャンクの位置
+
+    Notes
+    -----
+    分割は軸の大きさ，波長サンプル数，上限のみで決まり，並列数などによらない
+    """
+    chunk = plan_chunks(shape, as_grid(grid).n * 16 * SWEEP_WORK_ARRAYS, max_bytes)
+    starts = [range(0, n, c) for n, c in zip(shape, chunk)]
+    return [tuple(slice(s, min(s + c, n)) for s, c, n in zip(start, chunk, shape))
+            for start in itertools.product(*starts)]
+
+
+def evaluate_chunk(axes, index, polarized, n0, rgb, grid):
+    """
+    1チャンク分の反射率を計算
+
+    Parameters
+    ----------
+    axes : list of ndarray
+        (d, n1, n2, cos_in)の各軸
+    index : tuple of slice
+        チャンクの位置
+    polarized : list of int
+        偏光状態の軸
+    n0 : float
+        入射媒質の屈折率
+    rgb : bool
+        Trueの場合は波長軸をRGB値に変換
+    grid : SpectralGrid
+        波長サンプリング
+
+    Returns
+    -------
+    v : ndarray
+        チャンクの反射率(形状は(d, n1, n2, cos_in, polarized, 波長またはRGB))
+    """
+    # 各軸を(d, n1, n2, cos_in, 波長)の形にブロードキャスト
+    dc, n1c, n2c, cosc = [a[i].reshape([-1 if k == j else 1 for k in range(5)])
+                          for j, (a, i) in enumerate(zip(axes, index))]
+    sin_in = np.sqrt(np.maximum(0, 1 - cosc**2))
+    cos0 = np.sqrt(1 - sin_in**2)
+    cos1 = refraction_cos(sin_in, n0, n1c)
+    cos2 = refraction_cos(sin_in, n0, n2c)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rp, rs = irid_coefficient(cos0, cos1, cos2, n0, n1c, n2c, dc, grid.wavelength)
+    v = np.stack([polarized_reflectance(rp, rs, p) for p in polarized], axis=4)
+    if rgb:
+        v = spectra_to_rgb(v, grid)
+    return v
+
+
+def sweep_reflectance(d, n1, n2, cos_in, polarized=(UNPOLARIZED,), n0=1.0,
+                      rgb=False, max_bytes=SWEEP_MAX_BYTES, grid=None):
+    """
+    膜厚・屈折率・入射角・偏光状態の組み合わせについて反射率を一括計算
+
+    Parameters
+    ----------
+    d : ndarray
+        薄膜の膜厚の軸
+    n1 : ndarray
+        薄膜の屈折率の軸(複素数可)
+    n2 : ndarray
+        ベース層の屈折率の軸(複素数可)
+    cos_in : ndarray
+        入射角余弦の軸
+    polarized : list of int
+        偏光状態の軸
+    n0 : float
+        入射媒質の屈折率
+    rgb : bool
+        Trueの場合は波長軸をRGB値に変換
+    max_bytes : int
+        1チャンクあたりの作業メモリの上限
+    grid : SpectralGrid
+        波長サンプリング(省略時は既定の波長サンプリング)
+
+    Returns
+    -------
+    v : ndarray
+        反射率テンソル(形状は(d, n1, n2, cos_in, polarized, 波長またはRGB))
+
+    Notes
+    -----
+    単層薄膜(空気/薄膜/ベース層)を仮定
+    """
+    shape = tuple(np.size(a) for a in (d, n1, n2, cos_in, polarized))
+    v = np.empty(shape + (3 if rgb else as_grid(grid).n,))
+    for index, chunk in sweep_chunks(d, n1, n2, cos_in, polarized, n0, rgb, max_bytes, grid):
+        v[index] = chunk
+    return v
+
+
+class ParallelSweep:
+    """
+    パラメータ空間をチャンクに分割してプロセスプールで反射率を計算するクラス
+
+    Attributes
+    ----------
+    __axes : list of ndarray
+        (d, n1, n2, cos_in)の各軸
+    __polarized : list of int
+        偏光状態の軸
+    __n0 : float
+        入射媒質の屈折率
+    __rgb : bool
+        Trueの場合は波長軸をRGB値に変換
+    __grid : SpectralGrid
+        波長サンプリング
+    __max_bytes : int
+        1チャンクあたりの作業メモリの上限
+    __layout : list of tuple of slice
+        各チャンクの位置(chunk_layout)
+    __completed : ndarray
+        各チャンクの計算が完了したか
+    __cancel : Event
+        中止の要求
+
+    Notes
+    -----
+    各ワーカーは共有メモリ上の出力テンソルに直接書き込むため，結果はプロセス間で複製されない
+    チャンクの分割は並列数によらないため，計算結果は並列数によらず同じ
+    中止した場合は未計算のチャンクがNaNの出力テンソルを返す
+    """
+
+    def __init__(self, d, n1, n2, cos_in, polarized=(UNPOLARIZED,), n0=1.0,
+                 rgb=False, max_bytes=SWEEP_PARALLEL_MAX_BYTES, grid=None):
+        """
+        初期化
+
+        Parameters
+        ----------
+        d : ndarray
+            薄膜の膜厚の軸
+        n1 : ndarray
+            薄膜の屈折率の軸(複素数可)
+        n2 : ndarray
+            ベース層の屈折率の軸(複素数可)
+        cos_in : ndarray
+            入射角余弦の軸
+        polarized : list of int
+            偏光状態の軸
+        n0 : float
+            入射媒質の屈折率
+        rgb : bool
+            Trueの場合は波長軸をRGB値に変換
+        max_bytes : int
+            1チャンクあたりの作業メモリの上限
+        grid : SpectralGrid
+            波長サンプリング(省略時は既定の波長サンプリング)
+        """
+        self.__axes = sweep_axes(d, n1, n2, cos_in)
+        self.__polarized = [int(p) for p in np.atleast_1d(polarized)]
+        self.__n0 = n0
+        self.__rgb = bool(rgb)
+        self.__grid = as_grid(grid)
+        self.__max_bytes = max_bytes
+        self.__layout = chunk_layout(tuple(len(a) for a in self.__axes),
+                                     self.__grid, max_bytes)
+        self.__completed = np.zeros(len(self.__layout), dtype=bool)
+        self.__cancel = threading.Event()
+
+    @property
+    def shape(self):
+        return (tuple(len(a) for a in self.__axes) + (len(self.__polarized),)
+                + (3 if self.__rgb else self.__grid.n,))
+
+    @property
+    def layout(self):
+        return self.__layout
+
+    @property
+    def completed(self):
+        return self.__completed
+
+    @property
+    def cancelled(self):
+        return self.__cancel.is_set()
+
+    def cancel(self):
+        """
+        計算を中止
+
+        Notes
+        -----
+        別スレッドや進捗のコールバックから呼び出せる
+        投入済みのチャンク(並列計算時はワーカー数のSWEEP_INFLIGHT_PER_WORKER倍まで)は
+        完了まで待ち，それ以外のチャンクは計算しない
+        """
+        self.__cancel.set()
+
+    def run(self, workers=None, progress=None):
+        """
+        反射率を計算
+
+        Parameters
+        ----------
+        workers : int
+            ワーカープロセス数(省略時はCPU数，1の場合はこのプロセスで計算)
+        progress : callable
+            チャンクの完了ごとに progress(完了数, チャンク数) として呼び出す関数
+
+        Returns
+        -------
+        v : ndarray
+            反射率テンソル(形状は(d, n1, n2, cos_in, polarized, 波長またはRGB)，
+            中止した場合は未計算のチャンクがNaN)
+        """
+        workers = workers or os.cpu_count() or 1
+        self.__cancel.clear()
+        self.__completed[:] = False
+        if workers == 1:
+            v = np.full(self.shape, np.nan)
+            for i, index in enumerate(self.__layout):
+                if self.cancelled:
+                    break
+                v[index] = evaluate_chunk(self.__axes, index, self.__polarized,
+                                          self.__n0, self.__rgb, self.__grid)
+                self.__report(i, progress)
+            return v
+        # プロセスプールはimport時間が長いため並列計算時のみ読み込む
+        from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+        from multiprocessing import shared_memory
+        shm = shared_memory.SharedMemory(create=True, size=max(1, 8 * int(np.prod(self.shape))))
+        try:
+            out = np.ndarray(self.shape, dtype=float, buffer=shm.buf)
+            out.fill(np.nan)
+            initargs = (shm.name, self.shape, self.__axes, self.__polarized, self.__n0,
+                        self.__rgb, self.__grid.key, self.__max_bytes)
+            with ProcessPoolExecutor(workers, initializer=init_sweep_worker,
+                                     initargs=initargs) as executor:
+                # 投入済みで未完了のチャンクを一定数に保ち，完了するごとに補充する
+                chunks = iter(range(len(self.__layout)))
+                window = SWEEP_INFLIGHT_PER_WORKER * workers
+                pending = set()
+                while True:
+                    if not self.cancelled:
+                        for i in itertools.islice(chunks, window - len(pending)):
+                            pending.add(executor.submit(run_sweep_chunk, i))
+                    if not pending:
+                        break
+                    done, pending = wait(pending, timeout=SWEEP_POLL_INTERVAL,
+                                         return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self.__report(future.result(), progress)
+            v = np.array(out)
+            del out # 共有メモリを閉じる前にビューを破棄
+        finally:
+            shm.close()
+            shm.unlink()
+        return v
+
+    def __report(self, i, progress):
+        """チャンクの完了を記録して進捗を通知"""
+        self.__completed[i] = True
+        if progress is not None:
+            progress(int(np.count_nonzero(self.__completed)), len(self.__layout))
+
+
+def init_sweep_worker(name, shape, axes, polarized, n0, rgb, grid_key, max_bytes):
+    """
+    ワーカープロセスの初期化(共有メモリの出力テンソルを開く)
+
+    Parameters
+    ----------
+    name : string
+        共有メモリの名前
+    shape : tuple of int
+        出力テンソルの形状
+    axes : list of ndarray
+        (d, n1, n2, cos_in)の各軸
+    polarized : list of int
+        偏光状態の軸
+    n0 : float
+        入射媒質の屈折率
+    rgb : bool
+        Trueの場合は波長軸をRGB値に変換
+    grid_key : tuple
+        波長サンプリングの(開始波長, 終了波長, サンプル数)
+    max_bytes : int
+        1チャンクあたりの作業メモリの上限
+    """
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(name=name)
+    grid = SpectralGrid(*grid_key)
+    _sweep_worker.update(
+        shm=shm, out=np.ndarray(shape, dtype=float, buffer=shm.buf),
+        axes=axes, polarized=polarized, n0=n0, rgb=rgb, grid=grid,
+        layout=chunk_layout(tuple(len(a) for a in axes), grid, max_bytes))
+
+
+def run_sweep_chunk(i):
+    """
+    ワーカープロセスで1チャンク分の反射率を計算して共有メモリに書き込む
+
+    Parameters
+    ----------
+    i : int
+        チャンクの番号
+
+    Returns
+    -------
+    i : int
+        チャンクの番号
+    """
+    w = _sweep_worker
+    index = w['layout'][i]
+    w['out'][index] = evaluate_chunk(w['axes'], index, w['polarized'],
+                                     w['n0'], w['rgb'], w['grid'])
+    return i
+
+
+def parallel_sweep_reflectance(d, n1, n2, cos_in, polarized=(UNPOLARIZED,), n0=1.0,
+                               rgb=False, workers=None, progress=None,
+                               max_bytes=SWEEP_PARALLEL_MAX_BYTES, grid=None):
+    """
+    sweep_reflectanceをプロセスプールで並列に計算
+
+    Parameters
+    ----------
+    d : ndarray
+        薄膜の膜厚の軸
+    n1 : ndarray
+        薄膜の屈折率の軸(複素数可)
+    n2 : ndarray
+        ベース層の屈折率の軸(複素数可)
+    cos_in : ndarray
+        入射角余弦の軸
+    polarized : list of int
+        偏光状態の軸
+    n0 : float
+        入射媒質の屈折率
+    rgb : bool
+        Trueの場合は波長軸をRGB値に変換
+    workers : int
+        ワーカープロセス数(省略時はCPU数)
+    progress : callable
+        チャンクの完了ごとに progress(完了数, チャンク数) として呼び出す関数
+    max_bytes : int
+        1チャンクあたりの作業メモリの上限
+    grid : SpectralGrid
+        波長サンプリング(省略時は既定の波長サンプリング)
+
+    Returns
+    -------
+    v : ndarray
+        反射率テンソル(形状は(d, n1, n2, cos_in, polarized, 波長またはRGB))
+    """
+    return ParallelSweep(d, n1, n2, cos_in, polarized, n0, rgb, max_bytes, grid).run(workers, progress)
+
+
+def sweep_header(axes, polarized, n0, rgb, grid, max_bytes, fmt):
+    """
+    逐次出力ファイルの計算条件(JSONヘッダ)を生成
+
+    Parameters
+    ----------
+    axes : list of ndarray
+        (d, n1, n2, cos_in)の各軸
+    polarized : list of int
+        偏光状態の軸
+    n0 : float
+        入射媒質の屈折率
+    rgb : bool
+        Trueの場合は波長軸をRGB値に変換
+    grid : SpectralGrid
+        波長サンプリング
+    max_bytes : int
+        1チャンクあたりの作業メモリの上限
+    fmt : string
+        出力形式
+
+    Returns
+    -------
+    header : dict
+        計算条件(複素数の軸は[実部, 虚部]の組)
+    """
+    shape = tuple(len(a) for a in axes) + (len(polarized), 3 if rgb else grid.n)
+    return {
+        'version': SWEEP_FILE_VERSION,
+        'format': fmt,
+        'shape': list(shape),
+        'dtype': '<f8',
+        'axes': ['d', 'n1', 'n2', 'cos_in', 'polarized', 'rgb' if rgb else 'wavelength'],
+        'd': axes[0].tolist(),
+        'n1': [[n.real, n.imag] for n in axes[1].tolist()],
+        'n2': [[n.real, n.imag] for n in axes[2].tolist()],
+        'cos_in': axes[3].tolist(),
+        'polarized': list(polarized),
+        'n0': n0,
+        'rgb': bool(rgb),
+        'grid': list(grid.key),
+        'max_bytes': int(max_bytes),
+        'chunks': len(chunk_layout(shape[:4], grid, max_bytes)),
+    }
+
+
+def read_sweep_progress(path):
+    """
+    逐次出力ファイルの計算条件と完了したチャンク数を読み込む
+
+    Parameters
+    ----------
+    path : string
+        出力ファイルのパス
+
+    Returns
+    -------
+    header : dict
+        計算条件と完了したチャンク数('completed')，CSVの場合は書き込み済みのバイト数('bytes')
+        (計算条件か進捗が存在しない場合はNone)
+    """
+    try:
+        with open(path + '.json') as f:
+            header = json.load(f)
+        with open(path + '.progress') as f:
+            header.update(json.load(f))
+    except FileNotFoundError:
+        return None
+    return header
+
+
+def write_sweep_header(path, header):
+    """
+    逐次出力ファイルの計算条件を書き込む(計算開始時に一度だけ)
+
+    Parameters
+    ----------
+    path : string
+        出力ファイルのパス
+    header : dict
+        計算条件(sweep_header)
+    """
+    tmp = path + '.json.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(header, f)
+    os.replace(tmp, path + '.json')
+
+
+def write_sweep_progress(path, completed, offset):
+    """
+    逐次出力ファイルの進捗を書き込む(一時ファイルからの置き換えで途中の状態を残さない)
+
+    Parameters
+    ----------
+    path : string
+        出力ファイルのパス
+    completed : int
+        完了したチャンク数
+    offset : int
+        CSVの書き込み済みのバイト数(npy形式はNone)
+
+    Notes
+    -----
+    チャンクごとに呼び出すため，軸の値を含む計算条件とは別の小さなファイル(path + '.progress')に書き込む
+    """
+    tmp = path + '.progress.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'completed': completed, 'bytes': offset}, f)
+    os.replace(tmp, path + '.progress')
+
+
+def chunk_rows(axes, index, polarized, v):
+    """
+    チャンクの反射率をCSVの行に変換
+
+    Parameters
+    ----------
+    axes : list of ndarray
+        (d, n1, n2, cos_in)の各軸
+    index : tuple of slice
+        チャンクの位置
+    polarized : list of int
+        偏光状態の軸
+    v : ndarray
+        チャンクの反射率
+
+    Returns
+    -------
+    rows : ndarray
+        各行が(d, n1実部, n1虚部, n2実部, n2虚部, cos_in, polarized, 値...)の配列
+    """
+    d, n1, n2, cos_in, p = np.meshgrid(*[a[i] for a, i in zip(axes, index)],
+                                       np.asarray(polarized), indexing='ij')
+    params = [d, n1.real, n1.imag, n2.real, n2.imag, cos_in, p]
+    return np.column_stack([a.reshape(-1) for a in params] + [v.reshape(-1, v.shape[-1])])
+
+
+def write_sweep(path, d, n1, n2, cos_in, polarized=(UNPOLARIZED,), n0=1.0, rgb=False,
+                fmt='npy', max_bytes=SWEEP_MAX_BYTES, grid=None, resume=True):
+    """
+    パラメータ空間の反射率をチャンクごとにファイルへ逐次出力するジェネレータ
+
+    Parameters
+    ----------
+    path : string
+        出力ファイルのパス(計算条件はpath + '.json'，進捗はpath + '.progress'に出力)
+    d : ndarray
+        薄膜の膜厚の軸
+    n1 : ndarray
+        薄膜の屈折率の軸(複素数可)
+    n2 : ndarray
+        ベース層の屈折率の軸(複素数可)
+    cos_in : ndarray
+        入射角余弦の軸
+    polarized : list of int
+        偏光状態の軸
+    n0 : float
+        入射媒質の屈折率
+    rgb : bool
+        Trueの場合は波長軸をRGB値に変換
+    fmt : string
+        'npy'(出力テンソルの.npyファイル)または'csv'(1行に1つのパラメータの組)
+    max_bytes : int
+        1チャンクあたりの作業メモリの上限
+    grid : SpectralGrid
+        波長サンプリング(省略時は既定の波長サンプリング)
+    resume : bool
+        Trueの場合は同じ計算条件の出力ファイルがあれば最後に完了したチャンクの次から再開
+
+    Yields
+    ------
+    completed : int
+        書き込みが完了したチャンク数
+    chunks : int
+        チャンク数
+
+    Notes
+    -----
+    sweep_chunksの結果を1チャンクずつ書き込むため，メモリ使用量はmax_bytes程度で出力の大きさによらない
+    npy形式は出力テンソル全体の.npyファイルを確保し，メモリマップで各チャンクの位置に書き込む
+    csv形式はチャンクの順に行を追記する(行の順はパラメータの順と一致しない)
+    各チャンクの書き込みをディスクに反映してから進捗を更新するため，中断しても完了したチャンクは失われない
+    計算条件は開始時に一度だけ書き込み，チャンクごとには完了数と書き込み済みのバイト数のみ更新する
+    再開時は書きかけのチャンクを破棄して(csv形式は完了時点の長さに切り詰めて)計算し直す
+    計算条件が異なる既存の出力ファイルはresumeでも上書きしない(ValueError)
+    """
+    if fmt not in SWEEP_FORMATS:
+        raise ValueError('unknown sweep format: ' + str(fmt))
+    axes = sweep_axes(d, n1, n2, cos_in)
+    polarized = [int(p) for p in np.atleast_1d(polarized)]
+    grid = as_grid(grid)
+    header = sweep_header(axes, polarized, n0, rgb, grid, max_bytes, fmt)
+    progress = read_sweep_progress(path) if resume else None
+    if progress is not None:
+        completed = progress.pop('completed')
+        offset = progress.pop('bytes', None)
+        if progress != json.loads(json.dumps(header)):
+            raise ValueError('existing sweep output has different parameters: ' + path)
+    else:
+        completed, offset = 0, None
+        # 古い進捗を消してから計算条件を書き込む(進捗がなければ再開しない)
+        if os.path.exists(path + '.progress'):
+            os.remove(path + '.progress')
+        write_sweep_header(path, header)
+    shape = tuple(header['shape'])
+    if fmt == 'npy':
+        mode = 'r+' if progress is not None else 'w+'
+        out = np.lib.format.open_memmap(path, mode=mode, dtype=float, shape=shape)
+    else:
+        out = open(path, 'r+b' if progress is not None else 'wb')
+        if progress is None:
+            columns = ['d', 'n1', 'n1_imag', 'n2', 'n2_imag', 'cos_in', 'polarized']
+            columns += ['R', 'G', 'B'] if rgb else ['{:g}'.format(wl) for wl in grid.wavelength]
+            out.write((','.join(columns) + '\n').encode())
+            offset = out.tell()
+        out.truncate(offset)
+        out.seek(offset)
+    try:
+        write_sweep_progress(path, completed, offset)
+        chunks = sweep_chunks(axes[0], axes[1], axes[2], axes[3], polarized, n0, rgb,
+                              max_bytes, grid, first=completed)
+        for index, v in chunks:
+            if fmt == 'npy':
+                out[index] = v
+                out.flush()
+            else:
+                np.savetxt(out, chunk_rows(axes, index, polarized, v), delimiter=',', fmt='%.8g')
+                out.flush()
+                os.fsync(out.fileno())
+                offset = out.tell()
+            completed += 1
+            write_sweep_progress(path, completed, offset)
+            yield completed, header['chunks']
+    finally:
+        if fmt == 'npy':
+            del out
+        else:
+            out.close()
+
+
+def read_sweep(path):
+    """
+    npy形式の逐次出力ファイルを読み込む
+
+    Parameters
+    ----------
+    path : string
+        出力ファイルのパス
+
+    Returns
+    -------
+    v : ndarray
+        反射率テンソル(メモリマップされた読み取り専用配列)
+    header : dict
+        計算条件と進捗(read_sweep_progress)
+    """
+    return np.load(path, mmap_mode='r'), read_sweep_progress(path)
@@ -0,0 +1,440 @@
+import os
+import sys
+import tempfile
+import threading
+import numpy as np
+from illuminant import *
+from spectrum import *
+from utility import *
+
+
+# 定数
+RGB_TABLE_RES   = 32  # 係数表の各軸の分割数
+RGB_TABLE_START = 360 # 係数の波長の正規化範囲の開始波長
+RGB_TABLE_END   = 830 # 係数の波長の正規化範囲の終了波長
+RGB_TABLE_ITERATIONS = 100 # 係数のあてはめの最大反復回数
+RGB_TABLE_REGULARIZATION = 1e-2 # 係数のあてはめの正則化の重み
+RGB_TABLE_VERSION = 1 # 係数表の作成方法のバージョン(変わると保存済みの表は無効)
+RGB_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              '..', 'data', 'upsampling') # 係数表の保存先
+
+_rgb_table = None # 読み込み済みの係数表
+_rgb_table_lock = threading.Lock()
+
+
+def sigmoid(x, out=None):
+    """
+    係数表で使用するシグモイド関数
+
+    Parameters
+    ----------
+    x : ndarray
+        入力値
+    out : ndarray
+        出力先(入力と同じ配列も可)
+
+    Returns
+    -------
+    s : ndarray
+        0.5 + x / (2 sqrt(1 + x^2))(値域は(0, 1))
+    """
+    x = np.asarray(x, dtype=float)
+    s = np.divide(x, np.hypot(x, 1), out=out)
+    np.multiply(s, 0.5, out=s)
+    return np.add(s, 0.5, out=s)
+
+
+def table_scale(res=RGB_TABLE_RES):
+    """
+    係数表の最大成分軸の値
+
+    Parameters
+    ----------
+    res : int
+        分割数
+
+    Returns
+    -------
+    z : ndarray
+        各格子点の最大成分の値(0と1の付近を密にする)
+    """
+    t = np.linspace(0, 1, res)
+    t = t * t * (3 - 2 * t)
+    return t * t * (3 - 2 * t)
+
+
+def normalized_wavelength(grid=None):
+    """
+    係数の多項式に代入する正規化した波長
+
+    Parameters
+    ----------
+    grid : SpectralGrid
+        波長サンプリング(省略時は既定の波長サンプリング)
+
+    Returns
+    -------
+    t : ndarray
+        (λ - RGB_TABLE_START) / (RGB_TABLE_END - RGB_TABLE_START)
+
+    Notes
+    -----
+    範囲外の波長は端の値とし，可視域外の分光反射率を一定に保つ
+    """
+    wl = as_grid(grid).wavelength
+    return np.clip((wl - RGB_TABLE_START) / (RGB_TABLE_END - RGB_TABLE_START), 0.0, 1.0)
+
+
+def build_rgb_table(res=RGB_TABLE_RES, grid=None, illuminant='D65'):
+    """
+    RGB値から分光反射率の係数への変換表を作成
+
+    Parameters
+    ----------
+    res : int
+        各軸の分割数
+    grid : SpectralGrid
+        あてはめに使用する波長サンプリング(省略時は既定の波長サンプリング)
+    illuminant : string
+        あてはめに使用する光源名
+
+    Returns
+    -------
+    table : ndarray
+        係数表(形状は(3, res, res, res, 3)のfloat32)
+
+    Notes
+    -----
+    [Jakob and Hanika 2019]の方式
+    分光反射率を s(λ) = sigmoid(c0 t^2 + c1 t + c2)(tは正規化した波長)で表し，
+    最大成分の番号ごとに(最大成分の値, 次の成分/最大成分, その次の成分/最大成分)の
+    格子点でRGB値とのL*a*b*の差が最小となる係数をLevenberg-Marquardt法で求める
+    RGB値は光源下の完全拡散反射面のRGB値を(1, 1, 1)とする相対値とする
+    最大成分の値の方向には隣の格子点の解を初期値として順に解き，
+    最初の格子点は無彩色から目標色へ少しずつ近づけて解く
+    分光反射率で表せない色(色域の境界付近)は最も近い色になる
+    """
+    grid = as_grid(grid)
+    m = get_illuminant(illuminant).xyz_matrix(grid)
+    white = np.ones(grid.n) @ m
+    scale_rgb = xyz_to_rgb(white) # RGB値(1, 1, 1)を完全拡散反射面に対応させる
+    t = normalized_wavelength(grid)
+    basis = np.stack([t**2, t, np.ones_like(t)])
+    scale = table_scale(res)
+    x, y = np.meshgrid(np.linspace(0, 1, res), np.linspace(0, 1, res))
+    table = np.zeros((3, res, res, res, 3), dtype=np.float32)
+    start = res // 5
+    for l in range(3):
+        for order in (range(start, res), range(start, -1, -1)):
+            c = np.zeros((res * res, 3))
+            for zi in order:
+                z = scale[zi]
+                rgb = np.empty((res * res, 3))
+                rgb[:, l] = z
+                rgb[:, (l + 1) % 3] = x.ravel() * z
+                rgb[:, (l + 2) % 3] = y.ravel() * z
+                steps = np.linspace(0, 1, 9)[1:] if zi == start else [1.0]
+                for s in steps:
+                    target = rgb_to_xyz((z + s * (rgb - z)) * scale_rgb)
+                    c = fit_coefficients(c, xyz_to_lab(target, white), basis, m, white)
+                table[l, zi] = c.reshape(res, res, 3)
+    return table
+
+
+def fit_coefficients(c, target, basis, m, white, iterations=RGB_TABLE_ITERATIONS):
+    """
+    L*a*b*値に一致するシグモイド多項式の係数を求める
+
+    Parameters
+    ----------
+    c : ndarray
+        係数の初期値(形状は(個数, 3))
+    target : ndarray
+        目標のL*a*b*値(形状は(個数, 3))
+    basis : ndarray
+        正規化した波長の多項式の基底(形状は(3, 波長サンプル数))
+    m : ndarray
+        分光反射率からXYZ三刺激値への変換行列
+    white : ndarray
+        白色点のXYZ値
+    iterations : int
+        最大反復回数
+
+    Returns
+    -------
+    c : ndarray
+        係数(形状は(個数, 3))
+    """
+    def evaluate(c):
+        # L*a*b*値とその係数についてのヤコビ行列
+        u = c @ basis
+        ds = 0.5 * (1 + u * u) ** -1.5
+        xyz = sigmoid(u) @ m
+        f = xyz / white
+        df = np.where(f <= LAB_EPSILON, LAB_KAPPA,
+                      np.cbrt(np.maximum(f, 1e-30)) ** -2 / 3) / white
+        d = df[:, :, np.newaxis] * np.einsum('bn,kn,nj->bjk', ds, basis, m)
+        jacobian = np.stack([116 * d[:, 1],
+                             500 * (d[:, 0] - d[:, 1]),
+                             200 * (d[:, 1] - d[:, 2])], axis=1)
+        # 係数の大きさを抑える正則化項(表の補間で隣の格子点と大きく異ならないようにする)
+        r = np.concatenate([xyz_to_lab(xyz, white) - target, RGB_TABLE_REGULARIZATION * c], axis=1)
+        jacobian = np.concatenate([jacobian, np.broadcast_to(
+            RGB_TABLE_REGULARIZATION * np.eye(3), jacobian.shape)], axis=1)
+        return r, jacobian
+
+    mu = np.full(len(c), 1e-3) # 減衰係数
+    r, jacobian = evaluate(c)
+    e = np.sum(r * r, axis=1)
+    for _ in range(iterations):
+        jt = np.swapaxes(jacobian, 1, 2)
+        a = jt @ jacobian
+        a += (mu[:, np.newaxis] * (np.diagonal(a, axis1=1, axis2=2) + 1e-9))[:, :, np.newaxis] * np.eye(3)
+        c_new = c - np.linalg.solve(a, jt @ r[..., np.newaxis])[..., 0]
+        r_new, jacobian_new = evaluate(c_new)
+        e_new = np.sum(r_new * r_new, axis=1)
+        ok = e_new < e # 誤差が減少した場合のみ更新
+        c = np.where(ok[:, np.newaxis], c_new, c)
+        r = np.where(ok[:, np.newaxis], r_new, r)
+        jacobian = np.where(ok[:, np.newaxis, np.newaxis], jacobian_new, jacobian)
+        e = np.where(ok, e_new, e)
+        mu = np.clip(np.where(ok, mu * 0.3, mu * 10), 1e-12, 1e12)
+        if np.max(e) < 1e-8:
+            break
+    return c
+
+
+def rgb_table_path(res=RGB_TABLE_RES):
+    """
+    係数表のファイルのパス
+
+    Parameters
+    ----------
+    res : int
+        各軸の分割数
+
+    Returns
+    -------
+    path : string
+        係数表のファイルのパス
+    """
+    return os.path.join(RGB_TABLE_PATH, 'srgb_d65_{}_v{}.npy'.format(res, RGB_TABLE_VERSION))
+
+
+def save_rgb_table(table, path):
+    """
+    係数表をファイルに保存
+
+    Parameters
+    ----------
+    table : ndarray
+        係数表
+    path : string
+        保存先のパス
+
+    Notes
+    -----
+    一時ファイルに書き込んでから置き換えるため，読み込み中のプロセスは影響を受けない
+    アクセス権は通常のファイルの作成と同じ(FILE_MODE)にし，他のユーザーも読み込めるようにする
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, np.asarray(table, dtype=np.float32), allow_pickle=False)
+        os.chmod(tmp, FILE_MODE) # 一時ファイルは所有者のみ読み書き可のため
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def load_rgb_table(path=None, res=RGB_TABLE_RES):
+    """
+    係数表を読み込む
+
+    Parameters
+    ----------
+    path : string
+        係数表のファイルのパス(省略時はrgb_table_path(res))
+    res : int
+        各軸の分割数
+
+    Returns
+    -------
+    table : ndarray
+        係数表(メモリマップされた読み取り専用配列)
+
+    Notes
+    -----
+    既定の係数表は一度だけ読み込んで共有する
+    ファイルが存在しない場合は作成して保存する(保存できない場合はメモリ上でのみ保持)
+    作成には1分程度かかるため，python upsampling.pyで事前に作成しておく
+    """
+    global _rgb_table
+    default = path is None and res == RGB_TABLE_RES
+    if default and _rgb_table is not None:
+        return _rgb_table
+    with _rgb_table_lock:
+        if default and _rgb_table is not None:
+            return _rgb_table
+        if path is None:
+            path = rgb_table_path(res)
+        try:
+            table = np.load(path, mmap_mode='r', allow_pickle=False)
+        except OSError: # 存在しない
+            table = build_rgb_table(res)
+            table.setflags(write=False)
+            try:
+                save_rgb_table(table, path)
+            except OSError:
+                pass
+        if default:
+            _rgb_table = table
+    return table
+
+
+def rgb_to_coefficients(rgb, table=None):
+    """
+    RGB値を分光反射率の係数に変換
+
+    Parameters
+    ----------
+    rgb : ndarray
+        リニアなRGB値(形状は(..., 3)，[0, 1]の範囲外は飽和)
+    table : ndarray
+        係数表(省略時は既定の係数表)
+
+    Returns
+    -------
+    c : ndarray
+        シグモイド多項式の係数(形状は(..., 3))
+
+    Notes
+    -----
+    最大成分の番号の表を(最大成分の値, 残りの成分の比)で三線形補間する
+    """
+    if table is None:
+        table = load_rgb_table()
+    res = table.shape[1]
+    scale = table_scale(res)
+    rgb = np.clip(np.asarray(rgb, dtype=float), 0.0, 1.0)
+    shape = rgb.shape[:-1]
+    rgb = rgb.reshape(-1, 3)
+    index = np.arange(len(rgb))
+    l = np.argmax(rgb, axis=1)
+    z = rgb[index, l]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x = np.where(z > 0, rgb[index, (l + 1) % 3] / z, 0.0) * (res - 1)
+        y = np.where(z > 0, rgb[index, (l + 2) % 3] / z, 0.0) * (res - 1)
+    zi = np.clip(np.searchsorted(scale, z, side='right') - 1, 0, res - 2)
+    fz = (z - scale[zi]) / (scale[zi + 1] - scale[zi])
+    xi = np.clip(x.astype(int), 0, res - 2)
+    yi = np.clip(y.astype(int), 0, res - 2)
+    fx = (x - xi)[:, np.newaxis]
+    fy = (y - yi)[:, np.newaxis]
+    fz = fz[:, np.newaxis]
+    c = np.zeros((len(rgb), 3))
+    for dz, wz in ((0, 1 - fz), (1, fz)):
+        for dy, wy in ((0, 1 - fy), (1, fy)):
+            for dx, wx in ((0, 1 - fx), (1, fx)):
+                c += wz * wy * wx * table[l, zi + dz, yi + dy, xi + dx]
+    return c.reshape(shape + (3,))
+
+
+def coefficients_to_spectra(c, grid=None, out=None):
+    """
+    シグモイド多項式の係数から分光反射率を計算
+
+    Parameters
+    ----------
+    c : ndarray
+        係数(形状は(..., 3))
+    grid : SpectralGrid
+        波長サンプリング(省略時は既定の波長サンプリング)
+    out : ndarray
+        出力先(形状は(..., 波長サンプル数))
+
+    Returns
+    -------
+    v : ndarray
+        分光反射率(形状は(..., 波長サンプル数))
+    """
+    t = normalized_wavelength(grid)
+    basis = np.stack([t**2, t, np.ones_like(t)])
+    v = np.matmul(c, basis, out=out)
+    return sigmoid(v, out=v)
+
+
+def rgb_to_spectra(rgb, grid=None, out=None):
+    """
+    RGB値を分光反射率に変換
+
+    Parameters
+    ----------
+    rgb : ndarray
+        リニアなRGB値(形状は(..., 3))
+    grid : SpectralGrid
+        波長サンプリング(省略時は既定の波長サンプリング)
+    out : ndarray
+        出力先(形状は(..., 波長サンプル数))
+
+    Returns
+    -------
+    v : ndarray
+        分光反射率(形状は(..., 波長サンプル数))
+
+    Notes
+    -----
+    係数表はD65光源下のsRGB値にあてはめたもので，(1, 1, 1)は分光反射率1に対応する
+    """
+    return coefficients_to_spectra(rgb_to_coefficients(rgb), grid, out)
+
+
+def rgb_to_spectrum(rgb, grid=None, name='rgb'):
+    """
+    RGB値を分光反射率のスペクトルに変換
+
+    Parameters
+    ----------
+    rgb : ndarray
+        リニアなRGB値
+    grid : SpectralGrid
+        波長サンプリング(省略時は既定の波長サンプリング)
+    name : string
+        プロット時の名前
+
+    Returns
+    -------
+    spd : Spectrum
+        分光反射率
+    """
+    return Spectrum.from_array(rgb_to_spectra(rgb, grid), name=name, grid=grid)
+
+
+
+def rgb_to_spectrum_array(rgb, grid=None):
+    """
+    複数のRGB値を分光反射率のスペクトル配列に変換
+
+    Parameters
+    ----------
+    rgb : ndarray
+        リニアなRGB値(形状は(..., 3))
+    grid : SpectralGrid
+        波長サンプリング(省略時は既定の波長サンプリング)
+
+    Returns
+    -------
+    spectra : SpectrumArray
+        分光反射率(スペクトル数はRGB値の個数)
+    """
+    rgb = np.reshape(rgb, (-1, 3))
+    return SpectrumArray(rgb_to_spectra(rgb, grid), grid=grid)
+
+
+if __name__ == '__main__':
+    # 係数表を作成して保存
+    path = sys.argv[1] if len(sys.argv) > 1 else rgb_table_path()
+    save_rgb_table(build_rgb_table(), path)
@@ -1,4 +1,6 @@
-import csv
+import os
+import stat
+import tempfile
 import numpy as np
 
 
@@ -18,7 +20,62 @@ def lerp(t, v1, v2):
     return (1-t) * v1 + t * v2
 
 
-def load_spd(filename):
+def load_table(filename, columns, sidecar=False):
+    """
+    CSVファイルから数値の表を読み込む
+
+    Parameters
+    ----------
+    filename : string
+        CSVファイルのパス
+    columns : int
+        読み込む先頭からの列数
+    sidecar : bool
+        Trueの場合は解析結果をファイル名に.npyを付けたファイルに保存し，
+        次回以降はそのファイルをメモリマップして読み込む
+
+    Returns
+    -------
+    table : ndarray
+        値の表(形状は(行数, columns))
+
+    Notes
+    -----
+    全行を一度に解析して配列を確保する
+    保存したファイルの更新時刻とアクセス権をCSVファイルに揃え，
+    更新時刻が一致しない場合はCSVファイルを解析し直す
+    保存できない場合(書き込み不可のディレクトリなど)は保存せずに解析結果を返す
+    """
+    path = filename + '.npy'
+    source = os.stat(filename)
+    mtime = source.st_mtime_ns
+    if sidecar:
+        try:
+            if os.stat(path).st_mtime_ns == mtime:
+                table = np.load(path, mmap_mode='r', allow_pickle=False)
+                if table.ndim == 2 and table.shape[1] == columns:
+                    return table
+        except (OSError, ValueError): # 存在しないまたは壊れている
+            pass
+    table = np.loadtxt(filename, delimiter=',', usecols=range(columns), ndmin=2)
+    if sidecar:
+        try:
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    np.save(f, table, allow_pickle=False)
+                os.utime(tmp, ns=(mtime, mtime))
+                os.chmod(tmp, stat.S_IMODE(source.st_mode)) # 一時ファイルは所有者のみ読み書き可のため
+                os.replace(tmp, path)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        except OSError:
+            pass
+    return table
+
+
+def load_spd(filename, sidecar=False):
     """
     CVSファイルからSPDデータを読み込む
 
@@ -26,6 +83,8 @@ def load_spd(filename):
     ----------
     filename : string
         CSVファイルのパス
+    sidecar : bool
+        解析結果を.npyファイルに保存して再利用するか(load_tableを参照)
 
     Returns
     -------
@@ -38,17 +97,11 @@ def load_spd(filename):
     -----
     CSVファイルは1列目が波長で2列目が波長に対応する値
     """
-    with open(filename) as csvfile:
-        reader = csv.reader(csvfile)
-        wl = np.empty(0)
-        v = np.empty(0)
-        for row in reader:
-            wl = np.append(wl, float(row[0]))
-            v = np.append(v, float(row[1]))
-    return wl, v
+    table = load_table(filename, 2, sidecar)
+    return table[:, 0], table[:, 1]
 
 
-def load_cmf(filename):
+def load_cmf(filename, sidecar=False):
     """
     CVSファイルから等色関数データを読み込む
 
@@ -56,6 +109,8 @@ def load_cmf(filename):
     ----------
     filename : string
         CSVファイルのパス
+    sidecar : bool
+        解析結果を.npyファイルに保存して再利用するか(load_tableを参照)
 
     Returns
     -------
@@ -69,90 +124,415 @@ def load_cmf(filename):
     CSVファイルは1列目が波長で2-4列目が波長に対応するXYZ等色関数
     RGB値はガンマ補正前と仮定
     """
-    with open(filename) as csvfile:
-        reader = csv.reader(csvfile)
-        wl = np.empty(0)
-        xyz = np.empty((0,3))
-        for row in reader:
-            wl = np.append(wl, float(row[0]))
-            temp = np.array([[float(row[1]), float(row[2]), float(row[3])]])
-            xyz = np.append(xyz, temp, axis=0)
-        xyz = np.transpose(xyz)
-    return wl, xyz
+    table = load_table(filename, 4, sidecar)
+    return table[:, 0], table[:, 1:].T
 
 
-def xyz_to_rgb(xyz):
+def process_umask():
+    """
+    プロセスのumaskを取得
+
+    Returns
+    -------
+    mask : int
+        umask
+
+    Notes
+    -----
+    取得のために一時的に変更するため，他のスレッドがファイルを作成する前(import時)にのみ呼ぶ
+    """
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+# 新規ファイルの既定のアクセス権(tempfile.mkstempのファイルを共有する場合に設定)
+FILE_MODE = 0o666 & ~process_umask()
+
+# XYZからsRGB(リニア)への変換行列
+XYZ_TO_RGB = np.array([[ 3.2406, -1.5372, -0.4986],
+                       [-0.9689,  1.8758,  0.0415],
+                       [ 0.0557, -0.2040,  1.0570]])
+# sRGB(リニア)からXYZへの変換行列
+RGB_TO_XYZ = np.array([[0.4124, 0.3576, 0.1805],
+                       [0.2126, 0.7152, 0.0722],
+                       [0.0193, 0.1192, 0.9505]])
+# D65白色点のXYZ三刺激値(Y=1)
+WHITE_D65 = np.array([0.95047, 1.0, 1.08883])
+
+# sRGBの伝達関数の定数
+SRGB_THRESHOLD = 0.0031308 # リニア値の折れ点
+SRGB_SLOPE     = 12.92     # 折れ点以下の傾き
+SRGB_GAMMA     = 2.4       # 折れ点以上のべき指数
+SRGB_OFFSET    = 0.055     # 折れ点以上のオフセット
+
+# Lab変換の定数
+LAB_EPSILON = (6 / 29) ** 3
+LAB_KAPPA   = (29 / 6) ** 2 / 3
+
+# 量子化ビット数ごとのsRGB符号化の閾値表
+SRGB_LUT = {}
+
+
+def xyz_to_rgb(xyz, out=None):
     """
     XYZ三刺激値からRGB値へ変換
 
     Parameters
     ----------
     xyz : ndarray
-        XYZ値
+        XYZ値(形状は(..., 3))
+    out : ndarray
+        出力先(入力と同じ配列も可)
 
     Returns
     -------
     rgb : ndarray
-        RGB値
+        RGB値(形状は(..., 3))
 
     Notes
     -----
     XYZはCIE-XYZ表色系をRGBはsRGB色空間を採用
     RGB値はガンマ補正前と仮定
     """
-    rgb = np.empty(3)
-    rgb[0] =  3.2406*xyz[0] + -1.5372*xyz[1] + -0.4986*xyz[2]
-    rgb[1] = -0.9689*xyz[0] +  1.8758*xyz[1] +  0.0415*xyz[2]
-    rgb[2] =  0.0557*xyz[0] + -0.2040*xyz[1] +  1.0570*xyz[2]
-    return rgb
+    return np.matmul(xyz, XYZ_TO_RGB.T, out=out)
 
 
-def rgb_to_xyz(rgb):
+def rgb_to_xyz(rgb, out=None):
     """
     RGB値からXYZ三刺激値へ変換
 
     Parameters
     ----------
     rgb : ndarray
-        RGB値
+        RGB値(形状は(..., 3))
+    out : ndarray
+        出力先(入力と同じ配列も可)
 
     Returns
     -------
     xyz : ndarray
-        XYZ値
+        XYZ値(形状は(..., 3))
 
     Notes
     -----
     XYZはCIE-XYZ表色系をRGBはsRGB色空間を採用
     RGB値はガンマ補正前と仮定
     """
-    xyz = np.empty(3)
-    xyz[0] = 0.4124*rgb[0] + 0.3576*rgb[1] + 0.1805*rgb[2]
-    xyz[1] = 0.2126*rgb[0] + 0.7152*rgb[1] + 0.0722*rgb[2]
-    xyz[2] = 0.0193*rgb[0] + 0.1192*rgb[1] + 0.9505*rgb[2]
-    return rgb
+    return np.matmul(rgb, RGB_TO_XYZ.T, out=out)
+
+
+def srgb_encode(rgb, out=None):
+    """
+    リニアなRGB値にsRGBの伝達関数を適用
+
+    Parameters
+    ----------
+    rgb : ndarray
+        リニアなRGB値(任意の形状，スカラーも可)
+    out : ndarray
+        出力先(入力と同じ配列も可)
+
+    Returns
+    -------
+    v : ndarray
+        sRGBの符号化値(outを省略したスカラーの入力にはスカラー)
+
+    Notes
+    -----
+    IEC 61966-2-1の区分的な式(折れ点以下は線形)
+    負の値は符号を保って適用する
+    """
+    rgb = np.asarray(rgb, dtype=float)
+    linear = np.abs(rgb) <= SRGB_THRESHOLD
+    negative = np.signbit(rgb) # outが入力と同じ配列の場合に備えて書き込み前に取得
+    v = np.empty_like(rgb) if out is None else out
+    np.multiply(rgb, SRGB_SLOPE, out=v, where=linear)
+    curve = ~linear
+    np.abs(rgb, out=v, where=curve)
+    np.power(v, 1 / SRGB_GAMMA, out=v, where=curve)
+    np.multiply(v, 1 + SRGB_OFFSET, out=v, where=curve)
+    np.subtract(v, SRGB_OFFSET, out=v, where=curve)
+    np.negative(v, out=v, where=curve & negative)
+    return v[()] if out is None else v
+
+
+def srgb_decode(v, out=None):
+    """
+    sRGBの符号化値をリニアなRGB値に変換
+
+    Parameters
+    ----------
+    v : ndarray
+        sRGBの符号化値(任意の形状，スカラーも可)
+    out : ndarray
+        出力先(入力と同じ配列も可)
+
+    Returns
+    -------
+    rgb : ndarray
+        リニアなRGB値(outを省略したスカラーの入力にはスカラー)
+    """
+    v = np.asarray(v, dtype=float)
+    linear = np.abs(v) <= SRGB_THRESHOLD * SRGB_SLOPE
+    negative = np.signbit(v) # outが入力と同じ配列の場合に備えて書き込み前に取得
+    rgb = np.empty_like(v) if out is None else out
+    np.divide(v, SRGB_SLOPE, out=rgb, where=linear)
+    curve = ~linear
+    np.abs(v, out=rgb, where=curve)
+    np.add(rgb, SRGB_OFFSET, out=rgb, where=curve)
+    np.divide(rgb, 1 + SRGB_OFFSET, out=rgb, where=curve)
+    np.power(rgb, SRGB_GAMMA, out=rgb, where=curve)
+    np.negative(rgb, out=rgb, where=curve & negative)
+    return rgb[()] if out is None else rgb
+
+
+def srgb_lut(bits=8):
+    """
+    sRGB符号化の閾値表を取得
+
+    Parameters
+    ----------
+    bits : int
+        量子化ビット数
+
+    Returns
+    -------
+    lut : ndarray
+        各符号値に切り替わるリニア値(長さ2^bits - 1，読み取り専用)
+
+    Notes
+    -----
+    符号値kの区間の下端は srgb_decode((k - 0.5) / (2^bits - 1))
+    """
+    lut = SRGB_LUT.get(bits)
+    if lut is None:
+        code_max = 2 ** bits - 1
+        lut = srgb_decode((np.arange(1, code_max + 1) - 0.5) / code_max)
+        lut.setflags(write=False)
+        SRGB_LUT[bits] = lut
+    return lut
+
+
+def srgb_quantize(rgb, bits=8, out=None):
+    """
+    リニアなRGB値をsRGBの整数値に変換
+
+    Parameters
+    ----------
+    rgb : ndarray
+        リニアなRGB値(任意の形状)
+    bits : int
+        量子化ビット数(8または16)
+    out : ndarray
+        出力先(uint8またはuint16の配列)
+
+    Returns
+    -------
+    v : ndarray
+        sRGBの整数値(bitsが8ならuint8，16ならuint16)
+
+    Notes
+    -----
+    閾値表(srgb_lut)の二分探索のみで変換するため，べき乗を計算せず
+    srgb_encodeの値を四捨五入した場合と一致する
+    [0, 1]の範囲外は端の値に飽和する
+    """
+    index = np.searchsorted(srgb_lut(bits), rgb, side='right')
+    dtype = np.uint8 if bits <= 8 else np.uint16
+    if out is None:
+        return index.astype(dtype)
+    out[...] = index
+    return out
 
 
 def gamma_correction(rgb):
     """
-    gamma=2.2に対するガンマ補正を行い8ビットに変換(未使用)
+    sRGBの伝達関数によるガンマ補正を行い8ビットに変換
 
     Parameters
     ----------
     rgb : ndarray
-        RGB値
+        リニアなRGB値(形状は(..., 3))
 
     Returns
     -------
     rgb : ndarray
-        変換後のRGB値
-    """
-    for i in np.len(rgb):
-        if rgb[i] <= 0.0031308:
-            rgb[i] = 12.92 * rgb[i]
-        else:
-            rgb[i] = 1.055 * np.pow(rgb[i], 1/2.4) - 0.055
-    return rgb
+        変換後のRGB値(uint8)
+    """
+    return srgb_quantize(rgb, 8)
+
+
+def gamut_clip(rgb, out=None, preserve_hue=False):
+    """
+    RGB値を[0, 1]の色域に収める
+
+    Parameters
+    ----------
+    rgb : ndarray
+        リニアなRGB値(形状は(..., 3))
+    out : ndarray
+        出力先(入力と同じ配列も可)
+    preserve_hue : bool
+        Trueの場合は負の成分を輝度を保って無彩色方向に混ぜて除き，
+        1を超える場合は最大成分で割って収める(色相を保つ)
+
+    Returns
+    -------
+    rgb : ndarray
+        色域内のRGB値
+    """
+    if not preserve_hue:
+        return np.clip(rgb, 0.0, 1.0, out=out)
+    rgb = np.asarray(rgb, dtype=float)
+    if out is None:
+        out = np.array(rgb)
+    elif out is not rgb:
+        out[...] = rgb
+    y = np.maximum(out @ RGB_TO_XYZ[1], 0.0)[..., np.newaxis] # 輝度
+    low = np.min(out, axis=-1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = np.where(low < 0, y / (y - low), 1.0)
+    np.subtract(out, y, out=out)
+    np.multiply(out, t, out=out)
+    np.add(out, y, out=out)
+    high = np.max(out, axis=-1, keepdims=True)
+    np.divide(out, high, out=out, where=high > 1)
+    return np.clip(out, 0.0, 1.0, out=out)
+
+
+def xyz_to_lab(xyz, white=WHITE_D65, out=None):
+    """
+    XYZ三刺激値からCIE L*a*b*に変換
+
+    Parameters
+    ----------
+    xyz : ndarray
+        XYZ値(形状は(..., 3))
+    white : ndarray
+        白色点のXYZ値
+    out : ndarray
+        出力先(入力と同じ配列も可)
+
+    Returns
+    -------
+    lab : ndarray
+        L*a*b*値(形状は(..., 3))
+    """
+    f = np.divide(xyz, white, out=out)
+    small = f <= LAB_EPSILON
+    np.cbrt(f, out=f, where=~small)
+    np.multiply(f, LAB_KAPPA, out=f, where=small)
+    np.add(f, 4 / 29, out=f, where=small)
+    fx, fy, fz = f[..., 0].copy(), f[..., 1].copy(), f[..., 2].copy()
+    f[..., 0] = 116 * fy - 16
+    f[..., 1] = 500 * (fx - fy)
+    f[..., 2] = 200 * (fy - fz)
+    return f
+
+
+def lab_to_xyz(lab, white=WHITE_D65, out=None):
+    """
+    CIE L*a*b*からXYZ三刺激値に変換
+
+    Parameters
+    ----------
+    lab : ndarray
+        L*a*b*値(形状は(..., 3))
+    white : ndarray
+        白色点のXYZ値
+    out : ndarray
+        出力先(入力と同じ配列も可)
+
+    Returns
+    -------
+    xyz : ndarray
+        XYZ値(形状は(..., 3))
+    """
+    lab = np.asarray(lab, dtype=float)
+    fy = (lab[..., 0] + 16) / 116
+    fx = fy + lab[..., 1] / 500
+    fz = fy - lab[..., 2] / 200
+    f = np.stack([fx, fy, fz], axis=-1) if out is None else out
+    if out is not None:
+        f[..., 0], f[..., 1], f[..., 2] = fx, fy, fz
+    small = f <= 6 / 29
+    np.power(f, 3, out=f, where=~small)
+    np.subtract(f, 4 / 29, out=f, where=small)
+    np.divide(f, LAB_KAPPA, out=f, where=small)
+    return np.multiply(f, white, out=f)
+
+
+def delta_e76(lab1, lab2):
+    """
+    CIE76の色差
+
+    Parameters
+    ----------
+    lab1 : ndarray
+        L*a*b*値(形状は(..., 3))
+    lab2 : ndarray
+        L*a*b*値(形状は(..., 3))
+
+    Returns
+    -------
+    de : ndarray
+        色差(形状は(...))
+    """
+    return np.linalg.norm(np.subtract(lab1, lab2), axis=-1)
+
+
+def delta_e2000(lab1, lab2):
+    """
+    CIEDE2000の色差
+
+    Parameters
+    ----------
+    lab1 : ndarray
+        L*a*b*値(形状は(..., 3))
+    lab2 : ndarray
+        L*a*b*値(形状は(..., 3))
+
+    Returns
+    -------
+    de : ndarray
+        色差(形状は(...)，kL = kC = kH = 1)
+
+    Notes
+    -----
+    [Sharma 2005]を実装
+    """
+    lab1 = np.asarray(lab1, dtype=float)
+    lab2 = np.asarray(lab2, dtype=float)
+    l1, a1, b1 = lab1[..., 0], lab1[..., 1], lab1[..., 2]
+    l2, a2, b2 = lab2[..., 0], lab2[..., 1], lab2[..., 2]
+    c_mean = (np.hypot(a1, b1) + np.hypot(a2, b2)) / 2
+    g = 0.5 * (1 - np.sqrt(c_mean**7 / (c_mean**7 + 25.0**7)))
+    a1, a2 = (1 + g) * a1, (1 + g) * a2
+    c1, c2 = np.hypot(a1, b1), np.hypot(a2, b2)
+    h1 = np.degrees(np.arctan2(b1, a1)) % 360
+    h2 = np.degrees(np.arctan2(b2, a2)) % 360
+    zero = c1 * c2 == 0
+    dh = h2 - h1
+    dh = np.where(dh > 180, dh - 360, np.where(dh < -180, dh + 360, dh))
+    dh = np.where(zero, 0.0, dh)
+    dl = l2 - l1
+    dc = c2 - c1
+    dhh = 2 * np.sqrt(c1 * c2) * np.sin(np.radians(dh) / 2)
+    l_mean = (l1 + l2) / 2
+    c_mean = (c1 + c2) / 2
+    h_sum = h1 + h2
+    h_mean = np.where(np.abs(h1 - h2) <= 180, h_sum / 2,
+                      np.where(h_sum < 360, (h_sum + 360) / 2, (h_sum - 360) / 2))
+    h_mean = np.where(zero, h_sum, h_mean)
+    t = (1 - 0.17 * np.cos(np.radians(h_mean - 30)) + 0.24 * np.cos(np.radians(2 * h_mean))
+         + 0.32 * np.cos(np.radians(3 * h_mean + 6)) - 0.20 * np.cos(np.radians(4 * h_mean - 63)))
+    sl = 1 + 0.015 * (l_mean - 50)**2 / np.sqrt(20 + (l_mean - 50)**2)
+    sc = 1 + 0.045 * c_mean
+    sh = 1 + 0.015 * c_mean * t
+    rt = (-2 * np.sqrt(c_mean**7 / (c_mean**7 + 25.0**7))
+          * np.sin(np.radians(60 * np.exp(-((h_mean - 275) / 25)**2))))
+    return np.sqrt((dl / sl)**2 + (dc / sc)**2 + (dhh / sh)**2 + rt * (dc / sc) * (dhh / sh))
 
 
 def to_radian(deg):
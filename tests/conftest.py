@@ -0,0 +1,5 @@
+import os
+import sys
+
+# srcのモジュールはフラットに配置されているためパスに追加する
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
@@ -0,0 +1,52 @@
+import os
+import numpy as np
+from cache import *
+
+
+def test_disk_cache_keeps_unrelated_directories(tmp_path):
+    for name in ('venv_keep', 'videos', 'v1'):
+        (tmp_path / name).mkdir()
+    (tmp_path / 'notes.npy').write_bytes(b'user data')
+    DiskCache(str(tmp_path), 2)
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        ['venv_keep', 'videos', 'v1', 'notes.npy', DISK_CACHE_SUBDIR])
+
+
+def test_disk_cache_removes_old_versions_only(tmp_path):
+    root = tmp_path / DISK_CACHE_SUBDIR
+    for name in ('v1', 'v10', 'videos'):
+        (root / name).mkdir(parents=True)
+    cache = DiskCache(str(tmp_path), 2)
+    assert sorted(os.listdir(root)) == ['v2', 'videos']
+    assert cache.directory == str(root / 'v2')
+
+
+def test_disk_cache_clear_removes_entries_only(tmp_path):
+    cache = DiskCache(str(tmp_path), 1)
+    cache.put(('a', 1), np.arange(3))
+    other = os.path.join(cache.directory, 'readme.txt')
+    with open(other, 'w') as f:
+        f.write('keep')
+    cache.clear()
+    assert os.listdir(cache.directory) == ['readme.txt']
+    assert cache.get(('a', 1)) is None
+
+
+def test_disk_cache_evicts_oldest_over_limit(tmp_path):
+    value = np.zeros(100)
+    cache = DiskCache(str(tmp_path), 1)
+    cache.put(('size',), value)
+    size = cache.stats()['nbytes']
+    cache = DiskCache(str(tmp_path), 1, max_bytes=3 * size)
+    for i in range(10):
+        cache.put((i,), value)
+    stats = cache.stats()
+    assert stats['entries'] == 3 and stats['nbytes'] <= 3 * size
+    assert cache.get((9,)) is not None and cache.get((0,)) is None
+
+
+def test_disk_cache_entries_are_readable_by_others(tmp_path):
+    cache = DiskCache(str(tmp_path), 1)
+    cache.put(('mode',), np.zeros(4))
+    (entry,) = os.listdir(cache.directory)
+    assert os.stat(os.path.join(cache.directory, entry)).st_mode & 0o777 == FILE_MODE
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+from film import *
+
+
+def test_periodic_stack_rejects_empty_cell():
+    with pytest.raises(ValueError):
+        PeriodicStack([], 3)
+
+
+def test_transfer_matrix_rejects_empty_period():
+    # 空の単位胞(先頭と末尾+1が同じ)は無限ループせずにエラー
+    shape = (3, 1, 4)
+    cos_theta = np.ones(shape, dtype=complex)
+    eta = np.full(shape, 1.5, dtype=complex)
+    d = np.array([0.0, 100.0, 0.0])[:, np.newaxis, np.newaxis]
+    wl = np.linspace(400, 700, 4)
+    with pytest.raises(ValueError):
+        transfer_matrix_coefficient(cos_theta, eta, d, wl, periods=((1, 1, 3),))
+
+
+def test_periodic_stack_matches_unrolled_layers():
+    air = ThinFilm(0.0, Spectrum(constv=1.0))
+    a = ThinFilm(80.0, Spectrum(constv=2.0))
+    b = ThinFilm(120.0, Spectrum(constv=1.4))
+    base = ThinFilm(0.0, Spectrum(constv=1.5))
+    cos = np.cos(np.radians([0.0, 30.0, 60.0]))
+    periodic = evaluate_stack(FilmStack([air, PeriodicStack([a, b], 3), base]), cos)
+    unrolled = evaluate_stack(FilmStack([air, a, b, a, b, a, b, base]), cos)
+    assert np.allclose(periodic, unrolled)
+
+
+def oversampled_colour(films, cos, factor=256):
+    # 各波長帯をfactor分割した波長サンプリングで計算した色(参照値)
+    grid = SpectralGrid(START_WAVELENGTH, END_WAVELENGTH, NSAMPLESPECTRUM * factor)
+    v = evaluate_stack(FilmStack(films, grid=grid), cos)
+    return v.filled(np.nan) @ colour_matrix(grid)
+
+
+@pytest.mark.parametrize('d, n, angles', [
+    (1000.0, 2.4, [0.0]),
+    (1000.0, 2.4, [89.0]),
+    (2000.0, 1.5, np.arange(0.0, 81.0, 5.0)),
+])
+def test_adaptive_colour_matches_oversampled_reference(d, n, angles):
+    films = [ThinFilm(0.0, Spectrum(constv=1.0)), ThinFilm(d, Spectrum(constv=n)),
+             ThinFilm(0.0, Spectrum(constv=1.0))]
+    cos = np.cos(np.radians(angles))
+    reference = oversampled_colour(films, cos)
+    stack = FilmStack(films)
+    plain = evaluate_stack_colour(stack, cos, rgb=False).filled(np.nan)
+    adaptive = evaluate_stack_colour(stack, cos, rgb=False, adaptive=True).filled(np.nan)
+    error = np.max(np.abs(adaptive - reference))
+    assert error < 3e-4
+    assert error <= np.max(np.abs(plain - reference))
+
+
+def test_refinement_factors_are_powers_of_two():
+    films = [ThinFilm(0.0, Spectrum(constv=1.0)), ThinFilm(20000.0, Spectrum(constv=1.5)),
+             ThinFilm(0.0, Spectrum(constv=1.0))]
+    m = refinement_factors(FilmStack(films), np.cos(np.radians([0.0, 60.0])))
+    assert m.shape == (2, NSAMPLESPECTRUM)
+    assert np.all(m >= 1) and np.all(m <= ADAPTIVE_MAX_FACTOR)
+    assert np.all(m & (m - 1) == 0)
+
+
+def test_evaluate_colour_uses_disk_cache(tmp_path):
+    films = [ThinFilm(0.0, Spectrum(constv=1.0)), ThinFilm(5000.0, Spectrum(constv=1.5)),
+             ThinFilm(0.0, Spectrum(constv=1.0))]
+    cos = np.cos(np.radians(np.arange(0.0, 90.0, 10.0)))
+    set_disk_cache(str(tmp_path))
+    try:
+        first = Irid(films, cache=None).evaluate_colour(cos, adaptive=True)
+        second = Irid(films, cache=None).evaluate_colour(cos, adaptive=True)
+        assert get_disk_cache().stats()['hits'] == 1
+    finally:
+        set_disk_cache(None)
+    assert np.array_equal(first, second)
+
+
+def test_pack_nodes_round_trip():
+    # 求積点の組と全波長(分割あり)の組が混在する膜厚
+    films = [ThinFilm(0.0, Spectrum(constv=1.0)), ThinFilm(600.0, Spectrum(constv=1.5)),
+             ThinFilm(0.0, Spectrum(constv=1.0))]
+    groups = evaluate_stack_nodes(FilmStack(films), np.cos(np.radians(np.arange(90.0))),
+                                  adaptive=True)
+    restored = unpack_nodes(pack_nodes(groups))
+    assert len(restored) == len(groups)
+    for (rows, n, m, v), (rows2, n2, m2, v2) in zip(groups, restored):
+        assert np.array_equal(rows, rows2) and n == n2 and np.array_equal(v, v2)
+        assert (m is None and m2 is None) or np.array_equal(m, m2)
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from sweep import *
+
+
+def small_sweep():
+    return ParallelSweep(np.linspace(0.0, 1000.0, 40), [1.3, 1.5], [1.0, 1.5],
+                         np.cos(np.radians([0.0, 45.0])), max_bytes=1)
+
+
+def test_parallel_sweep_matches_serial():
+    serial = small_sweep().run(workers=1)
+    assert np.allclose(small_sweep().run(workers=2), serial, equal_nan=True)
+
+
+def test_parallel_sweep_cancel_stops_submitting():
+    sweep = small_sweep()
+    sweep.run(workers=2, progress=lambda done, total: sweep.cancel())
+    done = np.count_nonzero(sweep.completed)
+    assert len(sweep.layout) > 2 * SWEEP_INFLIGHT_PER_WORKER * 2
+    assert 1 <= done <= SWEEP_INFLIGHT_PER_WORKER * 2
+
+
+SWEEP_ARGS = (np.linspace(0.0, 1000.0, 30), [1.3, 1.5 + 0.1j], [1.0, 1.5],
+              np.cos(np.radians([0.0, 30.0, 60.0])), (P_POLARIZED, S_POLARIZED))
+
+
+def interrupted_sweep(path, fmt, stop):
+    # stopチャンクで中断してから再開
+    writer = write_sweep(path, *SWEEP_ARGS, fmt=fmt, max_bytes=1)
+    for _ in range(stop):
+        next(writer)
+    writer.close()
+    progress = read_sweep_progress(path)
+    assert progress['completed'] == stop
+    if fmt == 'csv':
+        with open(path, 'ab') as f:
+            f.write(b'0.5,1.3,0,1') # 書きかけの行
+    counts = [completed for completed, _ in write_sweep(path, *SWEEP_ARGS, fmt=fmt, max_bytes=1)]
+    assert counts[0] == stop + 1 and counts[-1] == progress['chunks']
+
+
+def test_write_sweep_resume_npy(tmp_path):
+    path = str(tmp_path / 'sweep.npy')
+    interrupted_sweep(path, 'npy', 5)
+    v, header = read_sweep(path)
+    assert header['completed'] == header['chunks']
+    assert np.allclose(v, sweep_reflectance(*SWEEP_ARGS), equal_nan=True)
+
+
+def test_write_sweep_resume_csv(tmp_path):
+    path = str(tmp_path / 'sweep.csv')
+    interrupted_sweep(path, 'csv', 7)
+    rows = np.loadtxt(path, delimiter=',', skiprows=1)
+    expected = sweep_reflectance(*SWEEP_ARGS)
+    assert len(rows) == np.prod(expected.shape[:-1])
+    d, n1, n2, cos_in, polarized = [np.asarray(a) for a in SWEEP_ARGS]
+    index = (np.abs(rows[:, [0]] - d).argmin(axis=1),
+             np.abs(rows[:, [1]] + 1j * rows[:, [2]] - n1).argmin(axis=1),
+             np.abs(rows[:, [3]] + 1j * rows[:, [4]] - n2).argmin(axis=1),
+             np.abs(rows[:, [5]] - cos_in).argmin(axis=1),
+             np.abs(rows[:, [6]] - polarized).argmin(axis=1))
+    assert len(set(zip(*index))) == len(rows)
+    assert np.allclose(rows[:, 7:], expected[index], rtol=1e-7, atol=1e-8, equal_nan=True)
+
+
+def test_write_sweep_rejects_different_parameters(tmp_path):
+    path = str(tmp_path / 'sweep.npy')
+    writer = write_sweep(path, *SWEEP_ARGS, max_bytes=1)
+    next(writer)
+    writer.close()
+    with pytest.raises(ValueError):
+        next(write_sweep(path, *SWEEP_ARGS, n0=1.33, max_bytes=1))
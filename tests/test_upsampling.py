@@ -0,0 +1,10 @@
+import os
+import numpy as np
+from upsampling import *
+
+
+def test_save_rgb_table_uses_default_file_mode(tmp_path):
+    path = str(tmp_path / 'table.npy')
+    save_rgb_table(np.zeros((2, 2, 3)), path)
+    assert os.stat(path).st_mode & 0o777 == FILE_MODE
+    assert np.array_equal(np.load(path), np.zeros((2, 2, 3), dtype=np.float32))
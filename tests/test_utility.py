@@ -0,0 +1,39 @@
+import os
+import stat
+import numpy as np
+from utility import *
+
+
+def test_srgb_encode_in_place_keeps_sign():
+    rgb = np.array([-0.5, -0.001, 0.0, 0.001, 0.5])
+    expected = srgb_encode(rgb)
+    v = rgb.copy()
+    assert srgb_encode(v, out=v) is v
+    assert np.array_equal(v, expected)
+    assert np.array_equal(expected, -srgb_encode(-rgb))
+
+
+def test_srgb_decode_in_place_keeps_sign():
+    v = np.array([-0.8, -0.01, 0.0, 0.01, 0.8])
+    expected = srgb_decode(v)
+    rgb = v.copy()
+    assert srgb_decode(rgb, out=rgb) is rgb
+    assert np.array_equal(rgb, expected)
+    assert np.allclose(srgb_encode(expected), v)
+
+
+def test_load_table_sidecar_keeps_source_permissions(tmp_path):
+    path = tmp_path / 'table.csv'
+    path.write_text('400,0.5\n500,0.25\n')
+    os.chmod(path, 0o644)
+    table = load_table(str(path), 2, sidecar=True)
+    assert stat.S_IMODE(os.stat(str(path) + '.npy').st_mode) == 0o644
+    assert np.array_equal(load_table(str(path), 2, sidecar=True), table)
+
+
+def test_srgb_accepts_scalars():
+    for x in (0.5, -0.5, 0.001, np.float64(0.2), np.array(0.7)):
+        v = srgb_encode(x)
+        assert np.ndim(v) == 0
+        assert np.isclose(v, srgb_encode(np.array([x]))[0])
+        assert np.isclose(srgb_decode(v), x)